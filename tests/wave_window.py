@@ -0,0 +1,98 @@
+# Regression check: a windowed vcd2wave() render equals the same slice of
+# the complete render, for every edge mode
+#
+# Usage:
+#
+#   python tests/wave_window.py
+#
+# The trace is generated: a clock and an exact copy of it, a counter
+# changing on the edges and a sparse bit and bus signal. Windows start on
+# and off the trigger edges, by time and by cycles.
+#
+
+import os
+import random
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+	'..', 'utils'))
+
+import wavedraw
+from vcdtrace import load_vcd
+
+TRIGGER = 'tb.clk'
+END = 3000
+
+def write_vcd(path, seed = 18):
+	rnd = random.Random(seed)
+	ev = {}
+	for t in range(0, END, 5):
+		clk = (t // 5) % 2
+		ev.setdefault(t, []).extend([ '%d!' % clk, '%d$' % clk ])
+		if clk:
+			ev[t].append('b{:b} %'.format((t // 10) % 256))
+	t = 0
+	while t < END:
+		t += rnd.choice([ 6, 11, 17, 23 ])
+		ev.setdefault(t, []).append(rnd.choice('01') + '"')
+	t = 0
+	while t < END:
+		t += rnd.choice([ 9, 13, 21 ])
+		ev.setdefault(t, []).append('b{:b} #'.format(rnd.randrange(16)))
+
+	with open(path, 'w') as f:
+		f.write('$timescale 1ns $end\n$scope module tb $end\n'
+			'$var wire 1 ! clk $end\n$var wire 1 " e $end\n'
+			'$var wire 4 # d [3:0] $end\n$scope module dut $end\n'
+			'$var wire 1 $ clk $end\n$var wire 8 % cnt [7:0] $end\n'
+			'$upscope $end\n$upscope $end\n$enddefinitions $end\n')
+		for t in sorted(ev):
+			f.write('#%d\n' % t)
+			for c in ev[t]:
+				f.write(c + '\n')
+
+def waves(wdrom):
+	return dict((s['name'], s['wave']) for s in wdrom['signal'])
+
+def check(vcdfile, edge, start, end, cycles):
+	"""Return the mismatches of a window against the complete render. The
+first column may show the value carried in where the complete one has '.'."""
+	full = waves(wavedraw.vcd2wave(vcdfile, TRIGGER, edge = edge))
+	trigger = [ t for t in load_vcd(vcdfile, [ TRIGGER ]).values() ][0]
+	slots = wavedraw.trigger_slots(trigger, edge)
+	if cycles:
+		i, j = start, end
+	else:
+		i = int((slots < start).sum())
+		j = int((slots <= end).sum())
+
+	window = waves(wavedraw.vcd2wave(vcdfile, TRIGGER, edge = edge,
+		start = start, end = end, cycles = cycles))
+	bad = []
+	for name, ref in full.items():
+		ref = ref[i:j]
+		got = window.get(name)
+		if got is None or len(got) != len(ref) or got[1:] != ref[1:] or \
+			(ref[:1] != '.' and got[:1] != ref[:1]):
+			bad.append( (edge, start, end, cycles, name, ref, got) )
+	return bad
+
+def main():
+	with tempfile.TemporaryDirectory() as d:
+		vcdfile = os.path.join(d, 'window.vcd')
+		write_vcd(vcdfile)
+		bad = []
+		n = 0
+		for edge in wavedraw.EDGES:
+			for start in range(0, 1200, 7):
+				bad += check(vcdfile, edge, start, start + 57, False)
+				bad += check(vcdfile, edge, start // 5, start // 5 + 40, True)
+				n += 2
+		for b in bad[:10]:
+			print("Mismatch %s start %s end %s cycles %s %s:\n  %s\n  %s" % b)
+		print("%d windows, %d mismatches" % (n, len(bad)))
+		return 1 if bad else 0
+
+if __name__ == '__main__':
+	sys.exit(main())
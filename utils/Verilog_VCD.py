@@ -1,8 +1,17 @@
 # This is a manual translation, from perl to python, of :
 # http://cpansearch.perl.org/src/GSULLIVAN/Verilog-VCD-0.03/lib/Verilog/VCD.pm
 
+import importlib
+import io
+import mmap
+import os
 import re
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 global timescale
 global endtime
 
@@ -27,88 +36,300 @@ def list_sigs(file):
     return sigs
 
 
-def parse_vcd(file, only_sigs=0, use_stdout=0, siglist=[], opt_timescale=''):
+def parse_vcd(file, only_sigs=0, use_stdout=0, siglist=[], opt_timescale='',
+              use_mmap=0, workers=0):
     """Parse input VCD file into data structure.
-    Also, print t-v pairs to STDOUT, if requested."""
+    Also, print t-v pairs to STDOUT, if requested.
+    With workers > 1, the value change section is parsed in parallel by
+    a pool of that many processes.
+    Wrapper around VCDFile.parse(), which also updates what
+    get_timescale() and get_endtime() return."""
+
+    vcd = VCDFile(file, siglist, opt_timescale)
+    try:
+        return vcd.parse(only_sigs, use_stdout, use_mmap, workers)
+    finally:
+        _publish(vcd)
+
+
+def iter_vcd(file, siglist=[], opt_timescale='', sigs=None, only_sigs=0,
+             use_mmap=0, until=None):
+    """Parse input VCD file as a stream of value changes.
+    Yields a (time, code, value) tuple for every change of a selected
+    signal, in file order, without keeping any history in memory.
+    If a dict is passed as 'sigs', it is filled with the signal
+    definitions (same layout as parse_vcd(), without 'tv') once the
+    header has been read, i.e. before the first change is yielded.
+    See VCDFile.iter_changes() for the options; get_timescale() and
+    get_endtime() are updated when the iteration ends."""
+
+    vcd = VCDFile(file, siglist, opt_timescale)
+    if sigs is not None:
+        vcd.data = sigs
+
+    try:
+        for ev in vcd.iter_changes(only_sigs, use_mmap, until):
+            yield ev
+    finally:
+        _publish(vcd)
+
 
+def parse_header(buf, file, siglist, opt_timescale, data):
+    """Parse the VCD header (everything up to $enddefinitions) from a
+    bytes-like object into 'data'.
+    Returns the time multiplier and the byte offset of the value change
+    section."""
+
+    vcd = VCDFile(file, siglist, opt_timescale)
+    vcd.data = data
+    pos = vcd.parse_header(buf)
+    _publish(vcd)
+    return (vcd.mult, pos)
+
+
+def _publish(vcd):
+    """Make get_timescale() and get_endtime() report what was parsed
+    from VCDFile 'vcd'."""
+
+    global timescale
     global endtime
 
-    usigs = {}
-    for i in siglist:
-        usigs[i] = 1
+    if vcd.timescale is not None:
+        timescale = vcd.timescale
+    if vcd.endtime is not None:
+        endtime = vcd.endtime
 
-    if len(usigs):
-        all_sigs = 0
-    else:
-        all_sigs = 1
 
-    data = {}
-    mult = 0
-    num_sigs = 0
-    hier = []
-    time = 0
+class VCDFile:
+    """A VCD file and what was parsed from it: the signal definitions
+    and value changes in 'data' (parse_vcd() layout), the 'timescale'
+    and the 'endtime' (None until known), and the time multiplier.
+    All parser state is kept in the object instead of module globals,
+    so different files can be parsed at the same time in several
+    threads.  parse_vcd(), iter_vcd() and list_sigs() are thin wrappers
+    around it."""
+
+    def __init__(self, file, siglist=[], opt_timescale=''):
+        self.file = file
+        self.siglist = siglist
+        self.opt_timescale = opt_timescale
+        self.data = {}
+        self.timescale = None
+        self.endtime = None
+        self.mult = 0
+        self.num_codes = 0  # Identifier codes in the header, selected or not
+
+    def sparse(self):
+        """True if the selected signals are few enough, compared to all
+        signals of the file, for the sparse byte scan to pay off."""
+
+        return bool(self.siglist) and \
+            len(self.data) * _SPARSE_RATIO <= self.num_codes
+
+    def parse(self, only_sigs=0, use_stdout=0, use_mmap=0, workers=0):
+        """Parse the file into 'data', which is returned.
+        Also, print t-v pairs to STDOUT, if requested.
+        With workers > 1, the value change section is parsed in parallel
+        by a pool of that many processes."""
+
+        data = self.data
+
+        if workers > 1 and not only_sigs and vcd_codec(self.file) is None:
+            for (code, tv) in self._iter_parallel(workers):
+                if (use_stdout):
+                    for (time, value) in tv:
+                        print( time, value )
+                else:
+                    net = data[code]
+                    if 'tv' not in net:
+                        net['tv'] = tv
+                    else:
+                        net['tv'].extend(tv)
+        else:
+            for (time, code, value) in self.iter_changes(only_sigs,
+                                                         use_mmap):
+                if (use_stdout):
+                    print( time, value )
+                else:
+                    net = data[code]
+                    if 'tv' not in net:
+                        net['tv'] = []
+                    net['tv'].append( (time, value) )
+
+        if ((len(data)>1) and use_stdout):
+            VCDParseError("Error: There are too many signals "\
+                    "(num_sigs) for output to STDOUT.  Use list_sigs "\
+                    "to select a single signal.")
+
+        return data
+
+    def list_sigs(self):
+        "Parse the header only and return the list of signal names."
+
+        for _ in self.iter_changes(only_sigs=1):
+            pass
+        return [ n['hier']+'.'+n['name']
+                 for v in self.data.values() for n in v['nets'] ]
+
+    def iter_changes(self, only_sigs=0, use_mmap=0, until=None):
+        """Yield a (time, code, value) tuple for every change of a
+        selected signal, in file order.  The signal definitions are in
+        'data' once the header has been read.
+        With use_mmap set, the value change section is scanned as bytes
+        from a memory map of the file, which is a lot faster.  This is
+        also done whenever a siglist is given, so that the lines of
+        unselected signals can be skipped without being decoded.
+        Compressed files (gzip, bzip2, xz) are decompressed on the fly
+        and always scanned as bytes.
+        If 'until' is given, parsing stops at the first timestamp past
+        it, so only the beginning of the file up to that time is read."""
+
+        file = self.file
+        data = self.data
+
+        if vcd_codec(file) is not None:
+            with open_vcd(file, 'rb') as fh:
+                rest = self._read_stream_header(fh)
+                if only_sigs:
+                    return
+
+                scanner = BodyScanner(_code_table(data), self.mult,
+                                      sparse=self.sparse())
+                try:
+                    for ev in scanner.scan_stream(fh, rest, until):
+                        yield ev
+                finally:
+                    self.endtime = scanner.time
+            return
+
+        if use_mmap or self.siglist:
+            with open(file, 'rb') as fh:
+                mm = _map_file(fh)
+                pos = self.parse_header(mm)
+                if only_sigs:
+                    return
+
+                scanner = BodyScanner(_code_table(data), self.mult,
+                                      sparse=self.sparse())
+                try:
+                    for ev in scanner.scan(mm, pos, len(mm), until):
+                        yield ev
+                finally:
+                    self.endtime = scanner.time
+            return
+
+        time = 0
+
+        with open(file, 'r') as fh:
+            self._parse_header_lines(fh)
+            if only_sigs:
+                return
+            mult = self.mult
+
+            while True:
+                line = fh.readline()
+                if line == '': # EOF
+                    break
+
+                # chomp
+                # s/ ^ \s+ //x
+                line = line.strip()
+
+                # if nothing left after we strip whitespace, go to next line
+                if line == '':
+                    continue
+
+                # put most frequent lines encountered at start of if/elif,
+                #   so other clauses usually don't need to be tested
+                if line[0] in ('b', 'B', 'r', 'R', 's'):
+                    (value,code) = line[1:].split()
+                    if (code in data):
+                        yield (time, code, value)
+
+                elif line[0] in ('0', '1', 'x', 'X', 'z', 'Z'):
+                    value = line[0]
+                    code = line[1:]
+                    if (code in data):
+                        yield (time, code, value)
+
+                elif line[0]=='#':
+                    time = mult * int(line[1:])
+                    self.endtime = time
+                    if until is not None and time > until:
+                        break
+
+    def parse_header(self, buf):
+        """Parse the VCD header (everything up to $enddefinitions) from a
+        bytes-like object into 'data'.
+        Returns the byte offset of the value change section."""
+
+        pos = buf.find(b'$enddefinitions')
+        if pos < 0:
+            pos = len(buf)
+        else:
+            pos = buf.find(b'$end', pos + 15)
+            pos = len(buf) if pos < 0 else pos + 4
+
+        header = io.StringIO(bytes(buf[:pos]).decode('latin-1'))
+        self._parse_header_lines(header)
+        return pos
+
+    def _read_stream_header(self, fh):
+        """Read and parse the header from binary stream 'fh'.
+        Returns the body data already read."""
+
+        head = bytearray()
+        while True:
+            block = fh.read(_CHUNK_SIZE)
+            head += block
+            p = head.find(b'$enddefinitions')
+            if (p >= 0 and head.find(b'$end', p + 15) >= 0) or not block:
+                break
+
+        pos = self.parse_header(head)
+        return bytes(head[pos:])
+
+    def _parse_header_lines(self, fh):
+        """Read header lines from text file 'fh' up to and including
+        $enddefinitions.  Sets the time multiplier and timescale."""
+
+        file = self.file
+        data = self.data
+        select = _selector(self.siglist)
+
+        if select is not None:
+            all_sigs = 0
+        else:
+            all_sigs = 1
+
+        num_sigs = 0
+        hier = []
+        seen = set() # (code, type, name, size, hier) of the nets in data
+        codes = set() # All codes of the header
 
-    with open(file, 'r') as fh:
         while True:
             line = fh.readline()
             if line == '': # EOF
                 break
 
-            # chomp
-            # s/ ^ \s+ //x
             line = line.strip()
-
-            # if nothing left after we strip whitespace, go to next line
             if line == '':
                 continue
 
-            # put most frequent lines encountered at start of if/elif, so other
-            #   clauses usually don't need to be tested
-            if line[0] in ('b', 'B', 'r', 'R', 's'):
-                (value,code) = line[1:].split()
-                if (code in data):
-                    if (use_stdout):
-                        print( time, value )
-                    else:
-                        if 'tv' not in data[code]:
-                            data[code]['tv'] = []
-                        data[code]['tv'].append( (time, value) )
-
-            elif line[0] in ('0', '1', 'x', 'X', 'z', 'Z'):
-                value = line[0]
-                code = line[1:]
-                if (code in data):
-                    if (use_stdout):
-                        print( time, value )
-                    else:
-                        if 'tv' not in data[code]:
-                            data[code]['tv'] = []
-                        data[code]['tv'].append( (time, value) )
-
-            elif line[0]=='#':
-                time = mult * int(line[1:])
-                endtime = time
-
-            elif "$enddefinitions" in line:
+            if "$enddefinitions" in line:
                 num_sigs = len(data)
                 if (num_sigs == 0):
                     if (all_sigs):
-                        VCDParseError("Error: No signals were found in the "\
-                                "VCD file "+file+". Check the VCD file for "\
-                                "proper var syntax.")
+                        VCDParseError("Error: No signals were found in "\
+                                "the VCD file "+file+". Check the VCD "\
+                                "file for proper var syntax.")
 
                     else:
-                        VCDParseError("Error: No matching signals were found "\
-                                "in the VCD file "+file+". Use list_sigs to "\
-                                "view all signals in the VCD file.")
-
-                if ((num_sigs>1) and use_stdout):
-                    VCDParseError("Error: There are too many signals "\
-                            "(num_sigs) for output to STDOUT.  Use list_sigs "\
-                            "to select a single signal.")
-
-                if only_sigs:
-                    break
+                        VCDParseError("Error: No matching signals were "\
+                                "found in the VCD file "+file+". Use "\
+                                "list_sigs to view all signals in the "\
+                                "VCD file.")
+                break
 
             elif "$timescale" in line:
                 statement = line
@@ -119,7 +340,8 @@ def parse_vcd(file, only_sigs=0, use_stdout=0, siglist=[], opt_timescale=''):
                         if "$end" in line:
                             break
 
-                mult = calc_mult(statement, opt_timescale)
+                (self.mult, self.timescale) = \
+                    _calc_timescale(statement, self.opt_timescale)
 
             elif "$scope" in line:
                 # assumes all on one line
@@ -140,7 +362,9 @@ def parse_vcd(file, only_sigs=0, use_stdout=0, siglist=[], opt_timescale=''):
                 name = "".join(ls[4:-1])
                 path = '.'.join(hier)
                 full_name = path + '.' + name
-                if (full_name in usigs) or all_sigs:
+                codes.add(code)
+                self.num_codes = len(codes)
+                if all_sigs or select(full_name):
                   if code not in data:
                       data[code] = {}
                   if 'nets' not in data[code]:
@@ -151,12 +375,548 @@ def parse_vcd(file, only_sigs=0, use_stdout=0, siglist=[], opt_timescale=''):
                       'size' : size,
                       'hier' : path,
                    }
-                  if var_struct not in data[code]['nets']:
+                  key = (code, type, name, size, path)
+                  if key not in seen:
+                      seen.add(key)
                       data[code]['nets'].append( var_struct )
 
-    fh.close()
+    def _iter_parallel(self, workers):
+        """Parallel parse of the value change section: the header is
+        parsed once into 'data', the body is split on timestamp lines and
+        handed to a process pool.  Yields (code, [(time, value), ...])
+        pieces in file order, so concatenating the pieces per code gives
+        the 'tv' lists.  Signals that don't change within a chunk simply
+        carry no entries, so their last value from an earlier chunk
+        stays in effect."""
+
+        from concurrent.futures import ProcessPoolExecutor
+
+        file = self.file
+        with open(file, 'rb') as fh:
+            mm = _map_file(fh)
+            pos = self.parse_header(mm)
+            n = min(workers * 4, (len(mm) - pos) // _MIN_PARALLEL_CHUNK + 1)
+            ranges = split_body(mm, pos, len(mm), n)
+
+        codes = _code_table(self.data)
+        mult = self.mult
+        jobs = len(ranges)
+        args = ([file] * jobs, [ r[0] for r in ranges ],
+                [ r[1] for r in ranges ], [codes] * jobs, [mult] * jobs,
+                [self.sparse()] * jobs)
+
+        if jobs > 1:
+            pool = ProcessPoolExecutor(max_workers=min(workers, jobs))
+            results = pool.map(_parse_range, *args)
+        else:
+            pool = None
+            results = map(_parse_range, *args)
+
+        try:
+            for (tv, time) in results:
+                self.endtime = time
+                for piece in tv.items():
+                    yield piece
+        finally:
+            if pool is not None:
+                pool.shutdown()
+
+
+def _wildcard(pattern):
+    """Compile a wildcard pattern, '*' matches any sequence and '?' any
+    single character.  Everything else, brackets included, is literal."""
+
+    rx = re.escape(pattern).replace(r'\*', '.*').replace(r'\?', '.')
+    return re.compile(rx + r'\Z', re.DOTALL)
+
+
+def _selector(siglist):
+    """Return a function telling whether a full signal name is selected
+    by 'siglist', or None if it is empty (all signals selected).
+    Entries are exact names, wildcard patterns or compiled regular
+    expressions, the latter two must match the whole name."""
+
+    names = set()
+    patterns = []
+    for s in siglist:
+        if hasattr(s, 'fullmatch'):
+            patterns.append(s.fullmatch)
+        elif '*' in s or '?' in s:
+            patterns.append(_wildcard(s).match)
+        else:
+            names.add(s)
+
+    if not names and not patterns:
+        return None
+    if not patterns:
+        return names.__contains__
+    return lambda name: name in names or any(m(name) for m in patterns)
+
+
+# Byte level scanner for the value change section
+
+_CHUNK_SIZE = 1 << 22
+
+# First chunk of a scan that ends at 'until', doubled up to _CHUNK_SIZE,
+# so that reading only the beginning of a big file stays cheap
+_FIRST_CHUNK_SIZE = 1 << 16
+
+_VECTORS = frozenset(b'bBrRs')
+_TIME = ord('#')
+_KEYWORD = ord('$')
+_UNCLEAN = (b'\r', b' \n', b'\t\n', b'\n ', b'\n\t')
+
+# Up to this many selected codes, of at most 8 bytes, the scanner can
+# look only at lines ending in one of them (needs numpy).  This is slower
+# than the line loop unless most lines belong to other signals, so it is
+# only done for a selection of at most 1/_SPARSE_RATIO of the codes.
+_SPARSE_CODES = 64
+_SPARSE_RATIO = 4
+if numpy is not None:
+    # Byte class lookup tables
+    _BLANK = numpy.zeros(256, bool)
+    _BLANK[list(b' \t')] = True
+    _SCALAR = numpy.zeros(256, bool)
+    _SCALAR[list(b'01xXzZ')] = True
+
+
+def _map_file(fh):
+    """Return a read-only memory map of the open file 'fh'.
+    Empty files can't be mapped and are returned as empty bytes."""
+    try:
+        return mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+    except ValueError:
+        return b''
+
+
+# Compressed VCD formats by magic bytes, as (magic, module) pairs
+_CODECS = (
+    (b'\x1f\x8b', 'gzip'),
+    (b'BZh', 'bz2'),
+    (b'\xfd7zXZ\x00', 'lzma'),
+)
+
+_READ_BUFFER = 1 << 20
+
+
+def vcd_codec(file):
+    """Return the name of the module to decompress 'file' with, or None
+    for a plain VCD file."""
+
+    with open(file, 'rb') as fh:
+        magic = fh.read(6)
+    for (m, codec) in _CODECS:
+        if magic.startswith(m):
+            return codec
+    return None
+
+
+def open_vcd(file, mode='r'):
+    """Open a VCD file for reading, in text ('r') or binary ('rb') mode.
+    gzip, bzip2 and xz compressed files are decompressed transparently
+    while reading, through a large read buffer."""
+
+    codec = vcd_codec(file)
+    if codec is None:
+        return open(file, mode, buffering=_READ_BUFFER)
+
+    stream = io.BufferedReader(importlib.import_module(codec).open(file, 'rb'),
+                               _READ_BUFFER)
+    if mode == 'rb':
+        return stream
+    return io.TextIOWrapper(stream)
+
+
+def _code_table(data):
+    "Map identifier codes as bytes to the 'data' keys"
+    return dict((code.encode('latin-1'), code) for code in data)
+
+
+class BodyScanner:
+    """Byte level scanner for the value change section of a VCD.
+    'codes' maps the identifier codes of interest (as bytes) to the code
+    strings that are reported.  The current (scaled) time is kept in the
+    'time' attribute, so a scan can be resumed or inspected from outside.
+    Set 'sparse' if the codes are a small subset of the file's codes, see
+    VCDFile.sparse().
+    """
+
+    def __init__(self, codes, mult, time=0, sparse=False):
+        self.codes = codes
+        self.mult = mult
+        self.time = time
+        self.in_comment = False
+        # Complete scalar change lines ('1!', 'x#', ...) resolve with a
+        # single dict lookup, without slicing the line:
+        self.scalar_lines = {}
+        for (cb, code) in codes.items():
+            for v in '01xXzZ':
+                self.scalar_lines[v.encode() + cb] = (code, v)
+
+        # Codes by length, packed into integers, for the sparse scan
+        self.keys = None
+        if sparse and numpy is not None and len(codes) <= _SPARSE_CODES and \
+           all(len(cb) <= 8 for cb in codes):
+            keys = {}
+            for cb in codes:
+                keys.setdefault(len(cb), []).append(int.from_bytes(cb, 'big'))
+            self.keys = dict((n, numpy.array(k, numpy.uint64))
+                             for (n, k) in keys.items())
+            # Lines can only match if their last two bytes are in 'tails'
+            self.tails = numpy.zeros(1 << 16, bool)
+            for cb in codes:
+                ends = [ cb[-2:] ] if len(cb) > 1 else \
+                       [ bytes([v]) + cb for v in b' \t01xXzZ' ]
+                for e in ends:
+                    self.tails[int.from_bytes(e, 'big')] = True
+
+    def scan(self, buf, start, stop, until=None):
+        """Scan 'buf' (typically a memory map) between the byte offsets
+        start and stop, which must be at line boundaries.
+        Yields (time, code, value) for every change of a selected signal.
+        Lines are dispatched on their first byte; keywords are only looked
+        at for '$' lines ($dumpvars, $end, $comment...).
+        If 'until' is given, the scan ends at the first timestamp past it."""
+
+        scalar_lines = self.scalar_lines
+        codes = self.codes
+        vectors = _VECTORS
+        mult = self.mult
+        time = self.time
+        values = {}
+        in_comment = self.in_comment
+
+        pos = start
+        size = _CHUNK_SIZE if until is None else _FIRST_CHUNK_SIZE
+        while pos < stop:
+            end = min(pos + size, stop)
+            size = min(2 * size, _CHUNK_SIZE)
+            if end < stop:
+                nl = buf.rfind(b'\n', pos, end)
+                if nl < 0:
+                    nl = buf.find(b'\n', end, stop)
+                    end = stop if nl < 0 else nl + 1
+                else:
+                    end = nl + 1
+
+            chunk = buf[pos:end]
+            pos = end
+
+            if self.keys is not None and not in_comment:
+                last = self._last_time(chunk)
+                if until is None or last is None or last <= until:
+                    events = self._scan_sparse(chunk, values)
+                    if events is not None:
+                        for ev in events:
+                            yield ev
+                        if last is not None:
+                            time = self.time = last
+                        continue
+
+            lines = chunk.split(b'\n')
+            if any(u in chunk for u in _UNCLEAN):
+                lines = [ l.strip() for l in lines ]
+
+            for line in lines:
+                hit = scalar_lines.get(line)
+                if hit is not None:
+                    if not in_comment:
+                        yield (time, hit[0], hit[1])
+                    continue
+
+                if not line:
+                    continue
+
+                c = line[0]
+                if in_comment:
+                    if b'$end' in line:
+                        in_comment = self.in_comment = False
+
+                elif c == _TIME:
+                    time = mult * int(line[1:])
+                    self.time = time
+                    if until is not None and time > until:
+                        return
+
+                elif c in vectors:
+                    (value, code) = line[1:].split()
+                    code = codes.get(code)
+                    if code is not None:
+                        v = values.get(value)
+                        if v is None:
+                            if len(values) > 4096:
+                                values.clear()
+                            v = values[value] = value.decode('latin-1')
+                        yield (time, code, v)
+
+                elif c == _KEYWORD:
+                    # $dumpvars, $dumpall, $dumpon, $dumpoff and their $end
+                    # are just markers, values inside are parsed as usual.
+                    if line.startswith(b'$comment') and b'$end' not in line:
+                        in_comment = self.in_comment = True
+
+    def _last_time(self, chunk):
+        "Return the time of the last timestamp in 'chunk', or None"
+
+        p = chunk.rfind(b'\n#') + 1
+        if p == 0 and not chunk.startswith(b'#'):
+            return None
+        e = chunk.find(b'\n', p)
+        return self.mult * int(chunk[p + 1:e] if e >= 0 else chunk[p + 1:])
+
+    def _scan_sparse(self, chunk, values):
+        """Scan a chunk for the few selected codes and return the list of
+        changes, or None if the chunk has comments or stray whitespace
+        and must be scanned line by line.  The bytes in front of every
+        newline are compared to the codes with numpy, only the matching
+        lines are split and looked up, all others are never touched."""
+
+        if b'\r' in chunk or b'$comment' in chunk:
+            return None
+        if not chunk.endswith(b'\n'):
+            chunk += b'\n'
+        a = numpy.frombuffer(chunk, numpy.uint8)
+        nl = numpy.flatnonzero(a == 10)
+        # The bytes before and after every newline; a.take() wraps around
+        # at the chunk ends, onto the final newline and the first byte
+        prev = a.take(nl - 1, mode='wrap')
+        succ = a.take(nl + 1, mode='wrap')
+        if _BLANK[prev].any() or _BLANK[succ].any():
+            return None
+
+        # Lines ending in the last two bytes of any code, then in a whole
+        # code preceded by a blank (vector) or a value at line start (scalar)
+        tail = a.take(nl - 2, mode='wrap').astype(numpy.uint16) << 8 | prev
+        cand = nl[self.tails[tail]]
+        match = numpy.zeros(len(cand), bool)
+        for (n, keys) in self.keys.items():
+            key = numpy.zeros(len(cand), numpy.uint64)
+            for i in range(n, 0, -1):
+                key = (key << 8) | a.take(cand - i, mode='wrap')
+            before = a.take(cand - n - 1, mode='wrap')
+            match |= numpy.isin(key, keys) & (_BLANK[before] |
+                (_SCALAR[before] & (a.take(cand - n - 2, mode='wrap') == 10)))
+        hits = cand[match]
+        if not len(hits):
+            return []
+
+        # Timestamp lines, the one before each hit gives its time
+        ts = nl[:-1][succ[:-1] == _TIME] + 1
+        if a[0] == _TIME:
+            ts = numpy.concatenate(([0], ts))
+        slots = numpy.searchsorted(ts, hits).tolist()
+        ts = ts.tolist()
+
+        scalar_lines = self.scalar_lines
+        codes = self.codes
+        mult = self.mult
+        time = self.time
+        slot = 0
+        events = []
+        for (e, k) in zip(hits.tolist(), slots):
+            if k != slot:
+                slot = k
+                t = ts[k - 1]
+                time = mult * int(chunk[t + 1:chunk.find(b'\n', t)])
+
+            line = chunk[chunk.rfind(b'\n', 0, e) + 1:e]
+            hit = scalar_lines.get(line)
+            if hit is not None:
+                events.append( (time, hit[0], hit[1]) )
+            elif line[0] in _VECTORS:
+                (value, code) = line[1:].split()
+                code = codes.get(code)
+                if code is not None:
+                    v = values.get(value)
+                    if v is None:
+                        if len(values) > 4096:
+                            values.clear()
+                        v = values[value] = value.decode('latin-1')
+                    events.append( (time, code, v) )
+        return events
+
+    def scan_stream(self, fh, pending=b'', until=None):
+        """Scan the value change section from the binary stream 'fh', for
+        example a decompressor, block by block.  'pending' is body data
+        that was already read from the stream."""
+
+        while True:
+            block = fh.read(_CHUNK_SIZE)
+            buf = pending + block
+            if block:
+                stop = buf.rfind(b'\n') + 1
+            else:
+                stop = len(buf)
+
+            for ev in self.scan(buf, 0, stop, until):
+                yield ev
+
+            if not block or (until is not None and self.time > until):
+                return
+            pending = buf[stop:]
+
+
+class VCDFollower:
+    """Incremental parser for a VCD file that is still being written,
+    e.g. by a running GHDL or vvp simulation.  Every call of update()
+    parses only the complete lines appended since the previous call.
+    The accumulated changes are kept in 'data' (parse_vcd() layout), the
+    latest value of every signal in 'values' and the current time in
+    'time'.  The header, e.g. the timescale, is in the VCDFile 'vcd'."""
+
+    def __init__(self, file, siglist=[], opt_timescale=''):
+        self.file = file
+        self.siglist = siglist
+        self.opt_timescale = opt_timescale
+        self.reset()
+
+    def reset(self):
+        self.vcd = VCDFile(self.file, self.siglist, self.opt_timescale)
+        self.data = self.vcd.data
+        self.values = {}
+        self.pos = None   # Start of unparsed data, None until header is read
+        self.time = 0
+        self.scanner = None
+        self.stamp = None
+
+    def _read_header(self, fh):
+        """Read the header in growing blocks, only up to the block holding
+        '$enddefinitions $end'.  The body is scanned from its offset."""
+        head = bytearray()
+        size = _FIRST_CHUNK_SIZE
+        p = -1
+        while True:
+            block = fh.read(size)
+            if not block:
+                return False  # Header not complete yet
+            start = len(head)
+            head += block
+            if p < 0:
+                p = head.find(b'$enddefinitions', max(start - 14, 0))
+            if p >= 0 and head.find(b'$end', max(p + 15, start - 3)) >= 0:
+                break
+            size = min(2 * size, _CHUNK_SIZE)
+
+        self.pos = self.vcd.parse_header(head)
+        self.scanner = BodyScanner(_code_table(self.data), self.vcd.mult,
+                                   sparse=self.vcd.sparse())
+        return True
+
+    def update(self):
+        """Parse newly appended data.  Returns the number of new changes.
+        If the file was truncated or replaced (simulation restarted), it
+        is parsed again from the start."""
+
+        with open(self.file, 'rb') as fh:
+            st = os.fstat(fh.fileno())
+            if self.stamp is not None and \
+                (st.st_ino != self.stamp[0] or st.st_size < self.stamp[1]):
+                self.reset()
+            self.stamp = (st.st_ino, st.st_size)
+
+            if self.pos is None and not self._read_header(fh):
+                return 0
+
+            fh.seek(self.pos)
+            buf = fh.read(st.st_size - self.pos)
+
+        # Only parse complete lines, the rest is picked up next time
+        stop = buf.rfind(b'\n') + 1
+        if stop == 0:
+            return 0
+
+        data = self.data
+        values = self.values
+        n = 0
+        for (time, code, value) in self.scanner.scan(buf, 0, stop):
+            net = data[code]
+            if 'tv' not in net:
+                net['tv'] = []
+            net['tv'].append( (time, value) )
+            values[code] = value
+            n += 1
+
+        self.pos += stop
+        self.time = self.vcd.endtime = self.scanner.time
+        return n
+
+
+# Parallel parsing
+
+# Don't bother splitting below this size per chunk:
+_MIN_PARALLEL_CHUNK = 1 << 22
+
+
+def split_body(buf, start, stop, n):
+    """Split the byte range start..stop of a VCD value change section
+    into up to n ranges.  Every range but the first starts with a '#'
+    timestamp line, so it can be scanned independently."""
+
+    bounds = [ start ]
+    step = (stop - start) // n
+    for i in range(1, n):
+        p = buf.find(b'\n#', max(start + i * step, bounds[-1]), stop)
+        if p < 0:
+            break
+        if p + 1 > bounds[-1]:
+            bounds.append(p + 1)
+    bounds.append(stop)
+
+    return [ (a, b) for (a, b) in zip(bounds[:-1], bounds[1:]) if b > a ]
 
-    return data
+
+def _parse_range(file, start, stop, codes, mult, sparse=False):
+    """Process pool worker: parse one byte range of the value change
+    section.  Returns the per-code (time, value) lists and the time of
+    the last timestamp seen."""
+
+    tv = {}
+    with open(file, 'rb') as fh:
+        mm = _map_file(fh)
+        scanner = BodyScanner(codes, mult, sparse=sparse)
+        for (time, code, value) in scanner.scan(mm, start, stop):
+            if code not in tv:
+                tv[code] = []
+            tv[code].append( (time, value) )
+    return (tv, scanner.time)
+
+
+# Powers of ten of the time units
+_EXPONENTS = {
+    'fs' : -15,
+    'ps' : -12,
+    'ns' : -9,
+    'us' : -6,
+    'ms' : -3,
+     's' : 0,
+}
+
+
+def split_timescale(ts):
+    """Split a timescale like '10ns' or '1 ps' into its integer multiplier
+    and the power of ten of its unit, e.g. (10, -9).
+    Returns None if it isn't a valid timescale."""
+
+    ts_match = re.match(r"(\d+)\s*([a-z]+)$", ts.strip().lower())
+    if not ts_match or ts_match.group(2) not in _EXPONENTS:
+        return None
+    return (int(ts_match.group(1)), _EXPONENTS[ts_match.group(2)])
+
+
+def time_factor(from_ts, to_ts):
+    """Return the factor between two timescales as exact integer fraction
+    (num, den): a time in units of 'from_ts' times num / den is the time
+    in units of 'to_ts'.  den is 1 unless 'to_ts' is coarser."""
+
+    (m0, e0) = split_timescale(from_ts)
+    (m1, e1) = split_timescale(to_ts)
+    num = m0 * 10 ** max(e0 - e1, 0)
+    den = m1 * 10 ** max(e1 - e0, 0)
+    # reduce, so that den == 1 whenever the factor is integral
+    a, b = num, den
+    while b:
+        a, b = b, a % b
+    return (num // a, den // a)
 
 
 def calc_mult (statement, opt_timescale=''):
@@ -165,12 +925,22 @@ def calc_mult (statement, opt_timescale=''):
     Input statement is complete timescale, for example:
       timescale 10ns end
     Input new_units is one of s|ms|us|ns|ps|fs.
-    Return numeric multiplier.
+    Return numeric multiplier: an exact integer, unless the new units
+    are coarser than the timescale of the file, then times can't be
+    integers anyway and the multiplier is a float.
     Also sets the package timescale variable.
     """
 
     global timescale
 
+    (mult, timescale) = _calc_timescale(statement, opt_timescale)
+    return mult
+
+
+def _calc_timescale(statement, opt_timescale=''):
+    """Like calc_mult(), but returns the multiplier together with the
+    resulting timescale instead of setting the package variable."""
+
     fields = statement.split()
     fields.pop()   # delete end from array
     fields.pop(0)  # delete timescale from array
@@ -180,56 +950,26 @@ def calc_mult (statement, opt_timescale=''):
     if (opt_timescale != ''):
         new_units = opt_timescale.lower()
         new_units = re.sub(r"\s", '', new_units)
-        timescale = "1"+new_units
+        new_timescale = "1"+new_units
 
     else:
-        timescale = tscale
-        return 1
+        return (1, tscale)
 
+    usage = '|'.join(sorted(_EXPONENTS, key=_EXPONENTS.get))
 
-    mult = 0
-    units = 0
-    ts_match = re.match(r"(\d+)([a-z]+)", tscale)
-    if ts_match:
-        mult  = int(ts_match.group(1))
-        units = ts_match.group(2).lower()
+    if split_timescale(tscale) is None:
+        raise VCDParseError("Error: Unsupported timescale found in VCD "\
+                "file: "+tscale+".  Refer to the Verilog LRM.  Supported "\
+                "units are: "+usage)
 
-    else:
-        VCDParseError("Error: Unsupported timescale found in VCD "\
-                "file: "+tscale+".  Refer to the Verilog LRM.")
-
-
-    mults = {
-        'fs' : 1e-15,
-        'ps' : 1e-12,
-        'ns' : 1e-09,
-        'us' : 1e-06,
-        'ms' : 1e-03,
-         's' : 1e-00,
-    }
-    mults_keys = mults.keys()
-    mults_keys.sort(key=lambda x : mults[x])
-    usage = '|'.join(mults_keys)
-
-    scale = 0
-    if units in mults:
-        scale = mults[units]
-
-    else:
-        VCDParseError("Error: Unsupported timescale units found in VCD "\
-                "file: "+units+".  Supported values are: "+usage)
-
-
-    new_scale = 0
-    if new_units in mults:
-        new_scale = mults[new_units]
-
-    else:
-        VCDParseError("Error: Illegal user-supplied "\
+    if new_units not in _EXPONENTS:
+        raise VCDParseError("Error: Illegal user-supplied "\
                 "timescale: "+new_units+".  Legal values are: "+usage)
 
-
-    return ((mult * scale) / new_scale)
+    (num, den) = time_factor(tscale, new_timescale)
+    if den == 1:
+        return (num, new_timescale)
+    return (num / den, new_timescale)
 
 
 def get_timescale():
@@ -340,6 +1080,11 @@ def get_endtime():
 #
 #     s ms us ns ps fs
 #
+# Times are kept as exact integers when scaling to the same or finer
+# units, e.g. a 10ns timescale to 'ps'.  Scaling to coarser units gives
+# float times.  vcdtrace.load_vcd() always parses integer times in the
+# units of the file and rescales its int64 time columns at the end.
+#
 # =item siglist
 #
 # If only a subset of the signals included in the VCD file are needed,
@@ -358,6 +1103,22 @@ def get_endtime():
 # returned data structure because only the time-value data for the selected
 # signals is loaded into the data structure.
 #
+# Besides exact names, the list may hold wildcard patterns, where C<*>
+# matches any sequence and C<?> any single character (brackets are taken
+# literally), and compiled regular expressions.  Both must match the full
+# hierarchical name:
+#
+#     signals = [
+#         'top.chip.cpu.alu.*',
+#         re.compile(r'top\.chip\.ram\d+\.addr\[.*\]'),
+#     ]
+#
+# With a signal list, the value change section is always scanned as bytes
+# (see C<use_mmap>).  If only a few signals are selected and numpy is
+# available, value change lines are matched against the identifier codes
+# of the selected signals in bulk, so the lines of all other signals are
+# skipped without being split or decoded.
+#
 # =item use_stdout
 #
 # It is possible to print time-value pairs directly to STDOUT for a
@@ -381,6 +1142,33 @@ def get_endtime():
 # Times are listed in the first column.
 # Times units can be controlled by the C<timescale> option.
 #
+# =item use_mmap
+#
+# Memory map the VCD file and scan the value change section as bytes,
+# instead of reading it line by line in text mode.  Only the header and
+# C<$> lines go through keyword matching, value change lines are
+# dispatched on their first byte.  The result is the same, but parsing
+# is noticeably faster, in particular for scalar signals.
+#
+#     vcd = parse_vcd(file, use_mmap=1)
+#
+# =item workers
+#
+# Parse the value change section with a pool of processes.  The header is
+# parsed once, then the rest of the file is split into byte ranges that
+# start at C<#> timestamp lines, which are parsed in parallel and merged in
+# order.  Only worthwhile for large files, small ones are parsed in one go.
+#
+#     vcd = parse_vcd(file, workers=8)
+#
+# =item Compressed files
+#
+# VCD files compressed with gzip, bzip2 or xz (C<.vcd.gz>, C<.vcd.bz2>,
+# C<.vcd.xz>) are recognized by their magic bytes and decompressed while
+# parsing, without temporary files.  They are always scanned as bytes
+# and can't be parsed in parallel.  See C<vcdbench.py> for a throughput
+# comparison of the codecs.
+#
 # =item only_sigs
 #
 # Parse a VCD file and return a reference to a data structure which
@@ -394,6 +1182,55 @@ def get_endtime():
 # =back
 #
 #
+# =head2 iter_vcd(file, siglist, opt_timescale, sigs, until)
+#
+# Parse a VCD file as a stream of value changes, without building up the
+# time-value lists.  This is the way to go for huge VCD files, as memory
+# use stays constant regardless of the file size.  The C<siglist> and
+# C<opt_timescale> options have the same meaning as for C<parse_vcd>.
+# Each change is yielded as a (time, code, value) tuple:
+#
+#     sigs = {}
+#     for time, code, value in iter_vcd(file, sigs=sigs):
+#         name = sigs[code]['nets'][0]['name']
+#
+# The optional C<sigs> dict receives the signal definitions as soon as
+# the header is parsed, using the same layout as C<parse_vcd>, without
+# the C<tv> key.
+#
+# With C<until> set, parsing stops at the first timestamp after that time
+# (in the units of C<opt_timescale>, if given), so only the beginning of
+# a long simulation is read:
+#
+#     for time, code, value in iter_vcd(file, ['top.clk'], until=40000):
+#
+# =head2 VCDFile(file, siglist, opt_timescale)
+#
+# Object holding the parse state of one VCD file: the signal store
+# C<data>, C<timescale> and C<endtime>.  parse_vcd(), iter_vcd() and
+# list_sigs() are thin wrappers around it, which additionally update the
+# package variables behind get_timescale() and get_endtime().  Those
+# variables are shared by all callers, so to parse several files at the
+# same time in threads, use VCDFile objects directly:
+#
+#     vcd = VCDFile('test.vcd', siglist=['top.clk'])
+#     data = vcd.parse()
+#     print(vcd.timescale, vcd.endtime)
+#
+# C<iter_changes(only_sigs, use_mmap, until)> is the streaming variant, like
+# iter_vcd().  See C<vcdtrace.load_parallel()> for a thread pool loader.
+#
+# =head2 VCDFollower(file, siglist, opt_timescale)
+#
+# Follow a VCD file that is still being written by a running simulation.
+# Each call of C<update> only parses what was appended since the last
+# call, so it can be polled cheaply, for example to refresh a live view:
+#
+#     f = VCDFollower('test.vcd', siglist=['top.clk'])
+#     while running:
+#         f.update()
+#         show(f.data, f.time)
+#
 # =head2 list_sigs(file)
 #
 # Parse a VCD file and return a list of all signals in the VCD file.
@@ -409,6 +1246,12 @@ def get_endtime():
 #     top.chip.cpu.alu.status
 #     top.chip.cpu.alu.sum[15:0]
 #
+# =head2 split_timescale(ts), time_factor(from_ts, to_ts)
+#
+# Helpers for exact time unit conversion.  C<split_timescale('10ns')>
+# returns C<(10, -9)>, C<time_factor('100ps', '1ns')> returns the exact
+# fraction C<(1, 10)> to multiply times with.
+#
 # =head2 get_timescale( )
 #
 # This returns a string corresponding to the timescale as specified
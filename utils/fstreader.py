@@ -0,0 +1,612 @@
+# Pure Python reader for GTKWave FST waveform files
+#
+# FST is block oriented: after the header, the file holds value change
+# blocks covering consecutive time ranges, plus geometry (signal widths)
+# and hierarchy blocks. Inside a value change block, every signal's
+# changes are stored as a separately compressed chain. Therefore only the
+# blocks overlapping a requested time window, and within those only the
+# chains of the requested signals, are decompressed.
+#
+# The result uses the same model as Verilog_VCD.parse_vcd(): a dict of
+# { 'nets' : [...], 'tv' : [(time, value), ...] } entries, keyed by the
+# FST signal handle instead of the VCD identifier code.
+#
+
+import gzip
+import mmap
+import struct
+import zlib
+
+import Verilog_VCD
+
+# Block types
+FST_BL_HDR               = 0
+FST_BL_VCDATA            = 1
+FST_BL_BLACKOUT          = 2
+FST_BL_GEOM              = 3
+FST_BL_HIER              = 4
+FST_BL_VCDATA_DYN_ALIAS  = 5
+FST_BL_HIER_LZ4          = 6
+FST_BL_HIER_LZ4DUO       = 7
+FST_BL_VCDATA_DYN_ALIAS2 = 8
+FST_BL_ZWRAPPER          = 254
+FST_BL_SKIP              = 255
+
+_VC_BLOCKS = (FST_BL_VCDATA, FST_BL_VCDATA_DYN_ALIAS, FST_BL_VCDATA_DYN_ALIAS2)
+
+# Hierarchy tags
+FST_ST_GEN_ATTRBEGIN = 252
+FST_ST_GEN_ATTREND   = 253
+FST_ST_VCD_SCOPE     = 254
+FST_ST_VCD_UPSCOPE   = 255
+
+# Variable types, by FST type code, named like in VCD $var statements
+_VAR_TYPES = [
+	'event', 'integer', 'parameter', 'real', 'real_parameter', 'reg',
+	'supply0', 'supply1', 'time', 'tri', 'triand', 'trior', 'trireg',
+	'tri0', 'tri1', 'wand', 'wire', 'wor', 'port', 'sparray', 'realtime',
+	'string', 'bit', 'logic', 'int', 'shortint', 'longint', 'byte',
+	'enum', 'shortreal'
+]
+
+# Non 0/1 scalar values, as encoded in a value change chain
+_RCV_STR = 'xzhuwl-?'
+
+_E = 2.7182818284590452354
+
+_HDR_LENGTH = 329
+
+class FSTParseError(Exception):
+	pass
+
+def is_fst(file):
+	"Check whether file is an FST file (as opposed to VCD)"
+	with open(file, 'rb') as f:
+		head = f.read(9)
+	if len(head) < 9:
+		return False
+	if head[0] == FST_BL_ZWRAPPER:
+		return True
+	return head[0] == FST_BL_HDR and \
+		struct.unpack('>Q', head[1:])[0] == _HDR_LENGTH
+
+def _varint(buf, pos):
+	"Decode unsigned LEB128 varint at pos. Returns (value, new pos)"
+	v = 0
+	shift = 0
+	while True:
+		b = buf[pos]
+		pos += 1
+		v |= (b & 0x7f) << shift
+		if b < 0x80:
+			return v, pos
+		shift += 7
+
+def _svarint(buf, pos):
+	"Decode signed LEB128 varint at pos"
+	v = 0
+	shift = 0
+	while True:
+		b = buf[pos]
+		pos += 1
+		v |= (b & 0x7f) << shift
+		shift += 7
+		if b < 0x80:
+			if b & 0x40:
+				v -= 1 << shift
+			return v, pos
+
+def _cstring(buf, pos):
+	end = buf.index(b'\0', pos)
+	return bytes(buf[pos:end]).decode('latin-1'), end + 1
+
+def _copy_match(out, dist, n):
+	"Append n bytes copied from dist bytes back, LZ77 style"
+	start = len(out) - dist
+	if dist >= n:
+		out += out[start:start + n]
+	else:
+		pattern = out[start:]
+		out += (pattern * (n // dist + 1))[:n]
+
+def fastlz_decompress(src, size):
+	"Decompress FastLZ (level 1 or 2) data"
+	out = bytearray()
+	level2 = (src[0] >> 5) == 1
+	ip = 1
+	n = len(src)
+	ctrl = src[0] & 31
+
+	while True:
+		if ctrl >= 32:
+			length = (ctrl >> 5) - 1
+			ofs = (ctrl & 31) << 8
+			if length == 6:
+				if level2:
+					while True:
+						code = src[ip]
+						ip += 1
+						length += code
+						if code != 255:
+							break
+				else:
+					length += src[ip]
+					ip += 1
+			code = src[ip]
+			ip += 1
+			dist = ofs + code + 1
+			if level2 and code == 255 and ofs == (31 << 8):
+				dist = ((src[ip] << 8) | src[ip + 1]) + 8191 + 1
+				ip += 2
+			_copy_match(out, dist, length + 3)
+		else:
+			ctrl += 1
+			out += src[ip:ip + ctrl]
+			ip += ctrl
+
+		if ip >= n:
+			break
+		ctrl = src[ip]
+		ip += 1
+
+	return bytes(out[:size])
+
+def lz4_decompress(src, size):
+	"Decompress an LZ4 block"
+	out = bytearray()
+	ip = 0
+	n = len(src)
+	while ip < n:
+		token = src[ip]
+		ip += 1
+		lit = token >> 4
+		if lit == 15:
+			while True:
+				b = src[ip]
+				ip += 1
+				lit += b
+				if b != 255:
+					break
+		out += src[ip:ip + lit]
+		ip += lit
+		if ip >= n:
+			break
+		dist = src[ip] | (src[ip + 1] << 8)
+		ip += 2
+		ml = token & 15
+		if ml == 15:
+			while True:
+				b = src[ip]
+				ip += 1
+				ml += b
+				if b != 255:
+					break
+		_copy_match(out, dist, ml + 4)
+
+	return bytes(out[:size])
+
+class _VCBlock:
+	"Decoded directory of one value change block"
+
+	def __init__(self, fst, typ, pos):
+		buf = fst.buf
+		self.fst = fst
+		seclen, self.begin, self.end = struct.unpack_from('>QQQ', buf, pos)
+
+		# Time table at the end of the block
+		tail = pos + seclen - 24
+		uclen, tclen, nitems = struct.unpack_from('>QQQ', buf, tail)
+		tdata = buf[tail - tclen:tail]
+		if uclen != tclen:
+			tdata = zlib.decompress(tdata)
+		times = []
+		t = 0
+		p = 0
+		for i in range(nitems):
+			d, p = _varint(tdata, p)
+			t += d
+			times.append(t)
+		self.times = times
+
+		# Frame: values of all signals at the block start
+		p = pos + 32
+		uclen, p = _varint(buf, p)
+		clen, p = _varint(buf, p)
+		self.frame_maxhandle, p = _varint(buf, p)
+		frame = buf[p:p + clen]
+		if uclen != clen:
+			frame = zlib.decompress(frame)
+		self.frame = frame
+		p += clen
+
+		maxhandle, p = _varint(buf, p)
+		self.vc_start = p
+		self.packtype = chr(buf[p])
+
+		# Chain table: offsets of the per signal value chains
+		indx_pntr = tail - tclen - 8
+		chain_clen = struct.unpack_from('>Q', buf, indx_pntr)[0]
+		indx_pos = indx_pntr - chain_clen
+		self._chains(buf, indx_pos, indx_pntr, typ, maxhandle)
+
+	def _chains(self, buf, start, stop, typ, maxhandle):
+		offsets = [ 0 ] * (maxhandle + 1)
+		lengths = [ 0 ] * (maxhandle + 1)
+		idx = 0
+		pidx = 0
+		pval = 0
+		prev_alias = 0
+		p = start
+
+		while p < stop:
+			if typ == FST_BL_VCDATA_DYN_ALIAS2:
+				if buf[p] & 1:
+					shval, p = _svarint(buf, p)
+					shval >>= 1
+					if shval > 0:
+						pval = offsets[idx] = pval + shval
+						if idx:
+							lengths[pidx] = pval - offsets[pidx]
+						pidx = idx
+					elif shval < 0:
+						lengths[idx] = prev_alias = shval
+					else:
+						lengths[idx] = prev_alias
+					idx += 1
+				else:
+					val, p = _varint(buf, p)
+					idx += val >> 1
+			else:
+				val, p = _varint(buf, p)
+				if val == 0:
+					val, p = _varint(buf, p)
+					lengths[idx] = -val
+					idx += 1
+				elif val & 1:
+					pval = offsets[idx] = pval + (val >> 1)
+					if idx:
+						lengths[pidx] = pval - offsets[pidx]
+					pidx = idx
+					idx += 1
+				else:
+					idx += val >> 1
+
+		offsets[idx] = start - self.vc_start
+		lengths[pidx] = offsets[idx] - offsets[pidx]
+
+		# Resolve aliases (signals with identical value chains)
+		for i in range(idx):
+			if lengths[i] < 0 and not offsets[i]:
+				a = -lengths[i] - 1
+				if a < i:
+					offsets[i] = offsets[a]
+					lengths[i] = lengths[a]
+
+		self.offsets = offsets
+		self.lengths = lengths
+
+	def frame_values(self):
+		"Return list of signal values at block start, by handle - 1"
+		fst = self.fst
+		frame = self.frame
+		values = []
+		p = 0
+		for i in range(self.frame_maxhandle):
+			n = fst.lens[i]
+			if fst.is_real[i]:
+				values.append(repr(struct.unpack_from(fst.dfmt, frame, p)[0]))
+				p += 8
+			elif n == 0:
+				values.append(None)
+			else:
+				values.append(bytes(frame[p:p + n]).decode('latin-1'))
+				p += n
+		return values
+
+	def chain(self, handle):
+		"Decode value changes of signal handle as (time, value) list"
+		i = handle - 1
+		off = self.offsets[i]
+		if not off:
+			return []
+
+		fst = self.fst
+		pos = self.vc_start + off
+		mem = fst.buf[pos:pos + self.lengths[i]]
+		uclen, p = _varint(mem, 0)
+		if uclen == 0:
+			data = mem[p:]
+		elif self.packtype == 'F':
+			data = fastlz_decompress(mem[p:], uclen)
+		elif self.packtype == '4':
+			data = lz4_decompress(mem[p:], uclen)
+		else:
+			data = zlib.decompress(mem[p:])
+
+		times = self.times
+		n = fst.lens[i]
+		tv = []
+		t = 0
+		p = 0
+		end = len(data)
+
+		if fst.is_real[i]:
+			dfmt = fst.dfmt
+			while p < end:
+				vli, p = _varint(data, p)
+				t += vli >> 1
+				tv.append( (times[t], repr(struct.unpack_from(dfmt, data, p)[0])) )
+				p += 8
+		elif n == 0:
+			while p < end:
+				vli, p = _varint(data, p)
+				t += vli >> 1
+				slen, p = _varint(data, p)
+				tv.append( (times[t], bytes(data[p:p + slen]).decode('latin-1')) )
+				p += slen
+		elif n == 1:
+			while p < end:
+				vli, p = _varint(data, p)
+				if vli & 1:
+					t += vli >> 4
+					v = _RCV_STR[(vli >> 1) & 7]
+				else:
+					t += vli >> 2
+					v = '1' if vli & 2 else '0'
+				tv.append( (times[t], v) )
+		else:
+			nbytes = (n + 7) // 8
+			fmt = '0%db' % (nbytes * 8)
+			while p < end:
+				vli, p = _varint(data, p)
+				t += vli >> 1
+				if vli & 1:
+					v = bytes(data[p:p + n]).decode('latin-1')
+					p += n
+				else:
+					b = int.from_bytes(data[p:p + nbytes], 'big')
+					v = format(b, fmt)[:n]
+					p += nbytes
+				tv.append( (times[t], v) )
+
+		return tv
+
+class FSTFile:
+	"""FST file reader. Parses header, geometry and hierarchy on creation,
+value change blocks only on demand."""
+
+	def __init__(self, file):
+		self.file = file
+		with open(file, 'rb') as fh:
+			try:
+				buf = mmap.mmap(fh.fileno(), 0, access = mmap.ACCESS_READ)
+			except ValueError:
+				raise FSTParseError("Empty file: " + file)
+
+		if buf[0] == FST_BL_ZWRAPPER:
+			# Whole file is a gzip wrapped FST
+			seclen = struct.unpack_from('>Q', buf, 1)[0]
+			buf = gzip.decompress(buf[17:1 + seclen])
+
+		self.buf = buf
+		self.blocks = []
+		self.sigs = {}
+		self.lens = []
+		self.is_real = []
+
+		hier = None
+		pos = 0
+		while pos + 9 <= len(buf):
+			typ = buf[pos]
+			seclen = struct.unpack_from('>Q', buf, pos + 1)[0]
+			if seclen == 0:
+				break
+			p = pos + 1
+			if typ == FST_BL_HDR:
+				self._header(p)
+			elif typ == FST_BL_GEOM:
+				self._geometry(p)
+			elif typ in (FST_BL_HIER, FST_BL_HIER_LZ4, FST_BL_HIER_LZ4DUO):
+				hier = (typ, p)
+			elif typ in _VC_BLOCKS:
+				begin, end = struct.unpack_from('>QQ', buf, p + 8)
+				self.blocks.append( (typ, p, begin, end) )
+			pos = p + seclen
+
+		if hier is not None:
+			self._hierarchy(*hier)
+		else:
+			# Writers without hierarchy compression put it into a sidecar file
+			try:
+				with open(file + '.hier', 'rb') as f:
+					self._parse_hierarchy(f.read())
+			except OSError:
+				raise FSTParseError("No hierarchy found in " + file)
+
+	def _header(self, p):
+		buf = self.buf
+		self.start_time, self.end_time = struct.unpack_from('>QQ', buf, p + 8)
+		if struct.unpack_from('<d', buf, p + 24)[0] == _E:
+			self.dfmt = '<d'
+		else:
+			self.dfmt = '>d'
+		self.num_scopes, self.num_hier_vars, self.num_vars, \
+			self.num_blocks = struct.unpack_from('>QQQQ', buf, p + 40)
+		exp = struct.unpack_from('b', buf, p + 72)[0]
+		self.timescale_exponent = exp
+		units = [ 's', 'ms', 'us', 'ns', 'ps', 'fs' ]
+		k = min(max((-exp + 2) // 3, 0), 5)
+		self.timescale = '%d%s' % (10 ** (exp + 3 * k), units[k])
+		self.version = _cstring(buf[p + 73:p + 73 + 128] + b'\0', 0)[0]
+		self.timezero = struct.unpack_from('>q', buf, p + 321)[0]
+
+	def _geometry(self, p):
+		buf = self.buf
+		seclen, uclen, maxhandle = struct.unpack_from('>QQQ', buf, p)
+		data = buf[p + 24:p + seclen]
+		if uclen != seclen - 24:
+			data = zlib.decompress(data)
+		q = 0
+		lens = []
+		is_real = []
+		for i in range(maxhandle):
+			v, q = _varint(data, q)
+			if v == 0:
+				lens.append(8)
+				is_real.append(True)
+			else:
+				lens.append(0 if v == 0xFFFFFFFF else v)
+				is_real.append(False)
+		self.lens = lens
+		self.is_real = is_real
+
+	def _hierarchy(self, typ, p):
+		buf = self.buf
+		seclen, uclen = struct.unpack_from('>QQ', buf, p)
+		data = buf[p + 16:p + seclen]
+		if typ == FST_BL_HIER:
+			data = gzip.decompress(data)
+		elif typ == FST_BL_HIER_LZ4:
+			data = lz4_decompress(data, uclen)
+		else:
+			clen, q = _varint(data, 0)
+			data = lz4_decompress(lz4_decompress(data[q:], clen), uclen)
+		self._parse_hierarchy(data)
+
+	def _parse_hierarchy(self, data):
+		sigs = self.sigs
+		scope = []
+		handle = 0
+		q = 0
+		n = len(data)
+		while q < n:
+			tag = data[q]
+			q += 1
+			if tag == FST_ST_VCD_SCOPE:
+				q += 1 # scope type
+				name, q = _cstring(data, q)
+				_, q = _cstring(data, q) # component
+				scope.append(name)
+			elif tag == FST_ST_VCD_UPSCOPE:
+				scope.pop()
+			elif tag == FST_ST_GEN_ATTRBEGIN:
+				q += 2 # attribute type, subtype
+				_, q = _cstring(data, q)
+				_, q = _varint(data, q)
+			elif tag == FST_ST_GEN_ATTREND:
+				pass
+			elif tag < len(_VAR_TYPES):
+				q += 1 # direction
+				name, q = _cstring(data, q)
+				length, q = _varint(data, q)
+				alias, q = _varint(data, q)
+				if alias == 0:
+					handle += 1
+					h = handle
+				else:
+					h = alias
+
+				vtype = _VAR_TYPES[tag]
+				if self.is_real and self.is_real[h - 1]:
+					size = '64'
+				elif length == 0:
+					size = '1'
+				else:
+					size = str(length)
+				net = {
+					'type' : vtype,
+					'name' : name.replace(' ', ''),
+					'size' : size,
+					'hier' : '.'.join(scope),
+				}
+				if h not in sigs:
+					sigs[h] = { 'nets' : [] }
+				sigs[h]['nets'].append(net)
+			else:
+				raise FSTParseError("Unknown hierarchy tag %d in %s" % \
+					(tag, self.file))
+
+	def list_sigs(self):
+		"Return list of full hierarchical signal names"
+		return [ n['hier'] + '.' + n['name'] \
+			for s in self.sigs.values() for n in s['nets'] ]
+
+	def lookup(self, siglist):
+		"""Return handles of the signals given by full hierarchical name,
+wildcard pattern or compiled regular expression"""
+		select = Verilog_VCD._selector(siglist)
+		return [ h for h, s in self.sigs.items() \
+			if any(select(n['hier'] + '.' + n['name']) for n in s['nets']) ]
+
+	def parse(self, siglist = [], t0 = None, t1 = None):
+		"""Return value changes of the signals in siglist (all if empty) in
+parse_vcd() layout. If a time window t0..t1 is given, only the value
+change blocks overlapping it are decoded, and each 'tv' list starts with
+the value in effect at t0."""
+		if siglist:
+			handles = self.lookup(siglist)
+		else:
+			handles = list(self.sigs.keys())
+
+		data = dict((h, { 'nets' : self.sigs[h]['nets'] }) for h in handles)
+		tvs = dict((h, []) for h in handles)
+		last = {}
+
+		for typ, p, begin, end in self.blocks:
+			if t1 is not None and begin > t1:
+				break
+			if t0 is not None and end < t0:
+				continue
+
+			blk = _VCBlock(self, typ, p)
+			frame = blk.frame_values()
+			for h in handles:
+				tv = blk.chain(h)
+				fv = frame[h - 1] if h <= len(frame) else None
+				# The frame holds the value before changes at 'begin'
+				if fv is not None and fv != last.get(h) and \
+					not (tv and tv[0][0] == begin):
+					tvs[h].append( (begin, fv) )
+				if tv:
+					tvs[h].extend(tv)
+					last[h] = tv[-1][1]
+				elif fv is not None:
+					last[h] = fv
+
+		for h in handles:
+			tv = tvs[h]
+			if t0 is not None or t1 is not None:
+				tv = _window(tv, t0, t1)
+			if tv:
+				data[h]['tv'] = tv
+
+		return data
+
+def _window(tv, t0, t1):
+	cur = None
+	out = []
+	for t, v in tv:
+		if t0 is not None and t <= t0:
+			cur = v
+		elif t1 is None or t <= t1:
+			out.append( (t, v) )
+		else:
+			break
+	if cur is not None:
+		out.insert(0, (t0, cur))
+	return out
+
+def parse_fst(file, siglist = [], only_sigs = 0, t0 = None, t1 = None):
+	"""Parse FST file into the data structure returned by
+Verilog_VCD.parse_vcd(), keyed by FST signal handle. Like parse_vcd(),
+this updates what Verilog_VCD.get_timescale() and get_endtime() return."""
+	fst = FSTFile(file)
+	Verilog_VCD.timescale = fst.timescale
+	Verilog_VCD.endtime = fst.end_time
+	if only_sigs:
+		return dict((h, { 'nets' : s['nets'] }) for h, s in fst.sigs.items())
+	return fst.parse(siglist, t0, t1)
+
+def list_sigs(file):
+	"Return list of the signal names in FST file"
+	return FSTFile(file).list_sigs()
@@ -0,0 +1,615 @@
+# Pure Python reader for GHDL GHW waveform files
+#
+# GHW is the native waveform format of GHDL (--wave=file.ghw). Unlike
+# VCD, it keeps the VHDL types: enumerations, integers, reals, records
+# and arrays. The header holds a string table, the type table and the
+# design hierarchy, which assigns a signal index to every scalar element
+# of every signal. The body is a sequence of snapshots (all values) and
+# cycles (changed values only, with delta encoded times in fs).
+#
+# The result uses the same model as Verilog_VCD.parse_vcd(). Scalar
+# elements are combined into nets like GHDL's VCD output does:
+#
+#   std_(u)logic, bit      : 1 bit 'wire', values '0', '1', 'x', 'z'
+#   .._vector of the above : n bit 'wire', named like 'data[7:0]'
+#   integer, physical      : 'integer' of 32 or 64 bits, binary value
+#   real                   : 'real', value as float string
+#   other enumerations     : 'string', value is the literal name
+#
+# Records and other arrays are broken down into their elements, e.g.
+# 'bus.addr' or 'regs[3]'. Nets are keyed by their signal index range.
+#
+
+import itertools
+import mmap
+import struct
+
+import Verilog_VCD
+from fstreader import _varint, _svarint, _window
+
+GHW_MAGIC = b'GHDLwave\n'
+
+# Type kinds, numbered like the GHDL runtime type information
+GHW_RTIK_TYPE_B2                  = 22
+GHW_RTIK_TYPE_E8                  = 23
+GHW_RTIK_TYPE_E32                 = 24
+GHW_RTIK_TYPE_I32                 = 25
+GHW_RTIK_TYPE_I64                 = 26
+GHW_RTIK_TYPE_F64                 = 27
+GHW_RTIK_TYPE_P32                 = 28
+GHW_RTIK_TYPE_P64                 = 29
+GHW_RTIK_TYPE_ARRAY               = 31
+GHW_RTIK_TYPE_RECORD              = 32
+GHW_RTIK_SUBTYPE_SCALAR           = 34
+GHW_RTIK_SUBTYPE_ARRAY            = 35
+GHW_RTIK_SUBTYPE_UNBOUNDED_ARRAY  = 37
+GHW_RTIK_SUBTYPE_RECORD           = 38
+
+_ENUMS  = (GHW_RTIK_TYPE_B2, GHW_RTIK_TYPE_E8, GHW_RTIK_TYPE_E32)
+_INTS   = (GHW_RTIK_TYPE_I32, GHW_RTIK_TYPE_I64,
+	GHW_RTIK_TYPE_P32, GHW_RTIK_TYPE_P64)
+_ARRAYS = (GHW_RTIK_TYPE_ARRAY, GHW_RTIK_SUBTYPE_ARRAY,
+	GHW_RTIK_SUBTYPE_UNBOUNDED_ARRAY)
+
+# Hierarchy entry kinds
+GHW_HIE_EOH          = 0
+GHW_HIE_DESIGN       = 1
+GHW_HIE_BLOCK        = 3
+GHW_HIE_GENERATE_IF  = 4
+GHW_HIE_GENERATE_FOR = 5
+GHW_HIE_INSTANCE     = 6
+GHW_HIE_PACKAGE      = 7
+GHW_HIE_PROCESS      = 13
+GHW_HIE_GENERIC      = 14
+GHW_HIE_EOS          = 15
+GHW_HIE_SIGNAL       = 16
+GHW_HIE_PORT_LINKAGE = 21
+
+_SCOPES = (GHW_HIE_DESIGN, GHW_HIE_BLOCK, GHW_HIE_GENERATE_IF,
+	GHW_HIE_GENERATE_FOR, GHW_HIE_INSTANCE, GHW_HIE_PACKAGE, GHW_HIE_GENERIC)
+
+# How scalar values are encoded in snapshots and cycles
+_RD_BYTE = 0
+_RD_SLEB = 1
+_RD_F64  = 2
+
+# std_ulogic literals in enumeration order, and their VCD representation
+_STD_ULOGIC = 'ux01zwlh-'
+_STD_TO_VCD = 'xx01zx01x'
+
+# Net formats
+_FMT_BITS   = 0
+_FMT_INT    = 1
+_FMT_REAL   = 2
+_FMT_STRING = 3
+
+class GHWParseError(Exception):
+	pass
+
+def is_ghw(file):
+	"Check whether file is a (possibly compressed) GHW file"
+	with Verilog_VCD.open_vcd(file, 'rb') as f:
+		return f.read(len(GHW_MAGIC)) == GHW_MAGIC
+
+class _Type:
+	"Entry of the GHW type table"
+	def __init__(self, kind, name, **attrs):
+		self.kind = kind
+		self.name = name
+		self.__dict__.update(attrs)
+
+def _base(t):
+	"Resolve scalar subtypes to their base type"
+	while t.kind == GHW_RTIK_SUBTYPE_SCALAR:
+		t = t.base
+	return t
+
+def _nel(t):
+	"Number of scalar elements of a type, -1 for unbounded types"
+	if t.kind in (GHW_RTIK_TYPE_ARRAY, GHW_RTIK_SUBTYPE_UNBOUNDED_ARRAY):
+		return -1
+	elif t.kind in (GHW_RTIK_SUBTYPE_ARRAY, GHW_RTIK_TYPE_RECORD,
+		GHW_RTIK_SUBTYPE_RECORD):
+		return t.nel
+	return 1
+
+def _literal_values(lits):
+	"""Return the values reported for the literals of an enumeration and
+whether it is a bit type (std_ulogic or bit)"""
+	chars = [ l[1] if len(l) == 3 and l[0] == "'" else l for l in lits ]
+	if ''.join(chars).lower() == _STD_ULOGIC:
+		return tuple(_STD_TO_VCD), True
+	elif chars == [ '0', '1' ]:
+		return ('0', '1'), True
+	return tuple(lits), False
+
+def _indices(rng):
+	left, right, downto = rng
+	if downto:
+		return range(left, right - 1, -1)
+	return range(left, right + 1)
+
+class GHWFile:
+	"""GHW file reader. Parses strings, types and hierarchy on creation,
+the value changes only on demand."""
+
+	def __init__(self, file):
+		self.file = file
+		if Verilog_VCD.vcd_codec(file) is None:
+			with open(file, 'rb') as fh:
+				try:
+					buf = mmap.mmap(fh.fileno(), 0, access = mmap.ACCESS_READ)
+				except ValueError:
+					raise GHWParseError("Empty file: " + file)
+		else:
+			with Verilog_VCD.open_vcd(file, 'rb') as fh:
+				buf = fh.read()
+
+		if buf[:len(GHW_MAGIC)] != GHW_MAGIC or buf[9] != 16 or buf[10] != 0:
+			raise GHWParseError("Not a GHW file: " + file)
+		self.version = buf[11]
+		if buf[12] == 1:
+			self.order = '<'
+		elif buf[12] == 2:
+			self.order = '>'
+		else:
+			raise GHWParseError("Bad byte order in " + file)
+
+		self.buf = buf
+		self.timescale = '1fs'
+		self.end_time = None
+		self.strings = [ '' ]
+		self.types = []
+		self.sigs = {}
+		self.ids = {}       # Net code -> list of signal indices
+		self.fmt = {}       # Net code -> (format, size)
+		self.readers = {}   # Signal index -> (encoding, literal values)
+
+		p = 16
+		while True:
+			tag = bytes(buf[p:p + 4])
+			p += 4
+			if tag == b'STR\0':
+				p = self._strings(p)
+			elif tag == b'TYP\0':
+				p = self._types(p)
+			elif tag == b'WKT\0':
+				p = self._wkt(p)
+			elif tag == b'HIE\0':
+				p = self._hierarchy(p)
+			elif tag == b'EOH\0':
+				break
+			else:
+				raise GHWParseError("Unexpected section %r in %s" % \
+					(tag, file))
+		self.body = p
+
+	def _i32(self, p):
+		return struct.unpack_from(self.order + 'i', self.buf, p)[0]
+
+	def _i64(self, p):
+		return struct.unpack_from(self.order + 'q', self.buf, p)[0]
+
+	def _f64(self, p):
+		return struct.unpack_from(self.order + 'd', self.buf, p)[0]
+
+	def _expect(self, p, tag):
+		if self.buf[p:p + 4] != tag:
+			raise GHWParseError("Expected %r at offset %d in %s" % \
+				(tag, p, self.file))
+		return p + 4
+
+	def _strings(self, p):
+		"""Read the string table. Every string shares a prefix with its
+predecessor, the prefix length follows the string as 5 bit groups with
+the terminating control character."""
+		buf = self.buf
+		n = self._i32(p + 4)
+		p += 12
+		s = bytearray()
+		for i in range(n):
+			while True:
+				c = buf[p]
+				p += 1
+				if c < 32 or 128 <= c < 160:
+					break
+				s.append(c)
+			self.strings.append(s.decode('latin-1'))
+			keep = c & 0x1f
+			shift = 5
+			while c >= 128:
+				c = buf[p]
+				p += 1
+				keep |= (c & 0x1f) << shift
+				shift += 5
+			del s[keep:]
+		return self._expect(p, b'EOS\0')
+
+	def _strid(self, p):
+		i, p = _varint(self.buf, p)
+		return self.strings[i], p
+
+	def _typeid(self, p):
+		i, p = _varint(self.buf, p)
+		return self.types[i - 1], p
+
+	def _range(self, p):
+		"Read range. Returns ((left, right, downto), new pos)"
+		buf = self.buf
+		t = buf[p]
+		kind = t & 0x7f
+		p += 1
+		if kind in (GHW_RTIK_TYPE_B2, GHW_RTIK_TYPE_E8):
+			left, right = buf[p], buf[p + 1]
+			p += 2
+		elif kind in _INTS or kind == GHW_RTIK_TYPE_E32:
+			left, p = _svarint(buf, p)
+			right, p = _svarint(buf, p)
+		elif kind == GHW_RTIK_TYPE_F64:
+			left, right = self._f64(p), self._f64(p + 8)
+			p += 16
+		else:
+			raise GHWParseError("Bad range kind %d in %s" % (kind, self.file))
+		return (left, right, bool(t & 0x80)), p
+
+	def _types(self, p):
+		buf = self.buf
+		n = self._i32(p + 4)
+		p += 8
+		for i in range(n):
+			kind = buf[p]
+			p += 1
+			name, p = self._strid(p)
+			if kind in _ENUMS:
+				nlits, p = _varint(buf, p)
+				lits = []
+				for j in range(nlits):
+					l, p = self._strid(p)
+					lits.append(l)
+				values, is_bit = _literal_values(lits)
+				t = _Type(kind, name, lits = lits, values = values,
+					is_bit = is_bit)
+			elif kind in _INTS or kind == GHW_RTIK_TYPE_F64:
+				if kind in (GHW_RTIK_TYPE_P32, GHW_RTIK_TYPE_P64) and \
+					self.version > 0:
+					nunits, p = _varint(buf, p)
+					for j in range(nunits):
+						_, p = _varint(buf, p)
+						_, p = _svarint(buf, p)
+				t = _Type(kind, name)
+			elif kind == GHW_RTIK_SUBTYPE_SCALAR:
+				base, p = self._typeid(p)
+				_, p = self._range(p)
+				t = _Type(kind, name, base = base)
+			elif kind == GHW_RTIK_TYPE_ARRAY:
+				el, p = self._typeid(p)
+				ndims, p = _varint(buf, p)
+				dims = []
+				for j in range(ndims):
+					d, p = self._typeid(p)
+					dims.append(d)
+				t = _Type(kind, name, el = el, dims = dims)
+			elif kind == GHW_RTIK_SUBTYPE_ARRAY:
+				base, p = self._typeid(p)
+				t, p = self._bounds(base, name, p)
+			elif kind == GHW_RTIK_SUBTYPE_UNBOUNDED_ARRAY:
+				base, p = self._typeid(p)
+				t = _Type(kind, name, el = base.el, dims = base.dims)
+			elif kind == GHW_RTIK_TYPE_RECORD:
+				nfields, p = _varint(buf, p)
+				fields = []
+				for j in range(nfields):
+					fname, p = self._strid(p)
+					ftype, p = self._typeid(p)
+					fields.append( (fname, ftype) )
+				nel = [ _nel(f[1]) for f in fields ]
+				t = _Type(kind, name, fields = fields,
+					nel = -1 if -1 in nel else sum(nel))
+			elif kind == GHW_RTIK_SUBTYPE_RECORD:
+				base, p = self._typeid(p)
+				t, p = self._bounds(base, name, p)
+			else:
+				raise GHWParseError("Unsupported type kind %d in %s" % \
+					(kind, self.file))
+			self.types.append(t)
+
+		if buf[p] != 0:
+			raise GHWParseError("Bad type table end in " + self.file)
+		return p + 1
+
+	def _bounds(self, base, name, p):
+		"Read the constraints that turn an unbounded type into a subtype"
+		if base.kind in _ARRAYS:
+			ranges = []
+			count = 1
+			for d in base.dims:
+				r, p = self._range(p)
+				ranges.append(r)
+				count *= len(_indices(r))
+			el = base.el
+			if _nel(el) < 0:
+				el, p = self._bounds(el, '', p)
+			return _Type(GHW_RTIK_SUBTYPE_ARRAY, name, el = el,
+				ranges = ranges, count = count,
+				nel = count * _nel(el)), p
+		else:
+			if base.nel >= 0:
+				fields = base.fields
+			else:
+				fields = []
+				for fname, ftype in base.fields:
+					if _nel(ftype) < 0:
+						ftype, p = self._bounds(ftype, '', p)
+					fields.append( (fname, ftype) )
+			return _Type(GHW_RTIK_SUBTYPE_RECORD, name or base.name,
+				fields = fields,
+				nel = sum(_nel(f[1]) for f in fields)), p
+
+	def _wkt(self, p):
+		"Well known types are recognized by their literals instead"
+		p += 4
+		while self.buf[p] != 0:
+			_, p = _varint(self.buf, p + 1)
+		return p + 1
+
+	def _value(self, t, p):
+		"Read a single value of scalar type t, as used by generate indices"
+		t = _base(t)
+		if t.kind in (GHW_RTIK_TYPE_B2, GHW_RTIK_TYPE_E8):
+			return t.lits[self.buf[p]], p + 1
+		elif t.kind == GHW_RTIK_TYPE_F64:
+			return repr(self._f64(p)), p + 8
+		v, p = _svarint(self.buf, p)
+		if t.kind == GHW_RTIK_TYPE_E32:
+			return t.lits[v], p
+		return str(v), p
+
+	def _hierarchy(self, p):
+		buf = self.buf
+		p += 16
+		scope = []
+		while True:
+			kind = buf[p]
+			p += 1
+			if kind == GHW_HIE_EOH:
+				break
+			elif kind == GHW_HIE_EOS:
+				scope.pop()
+			elif kind == GHW_HIE_PROCESS:
+				_, p = self._strid(p)
+			elif kind in _SCOPES:
+				name, p = self._strid(p)
+				if kind == GHW_HIE_GENERATE_FOR:
+					t, p = self._typeid(p)
+					v, p = self._value(t, p)
+					name = '%s(%s)' % (name, v)
+				scope.append(name)
+			elif GHW_HIE_SIGNAL <= kind <= GHW_HIE_PORT_LINKAGE:
+				name, p = self._strid(p)
+				t, p = self._typeid(p)
+				p = self._signal('.'.join(scope), name, t, p)
+			else:
+				raise GHWParseError("Unknown hierarchy entry %d in %s" % \
+					(kind, self.file))
+		return p
+
+	def _sigids(self, t, n, p):
+		"Read the signal indices of n scalar elements of type t"
+		ids = []
+		for i in range(n):
+			s, p = _varint(self.buf, p)
+			ids.append(s)
+			if s not in self.readers:
+				if t.kind in (GHW_RTIK_TYPE_B2, GHW_RTIK_TYPE_E8):
+					self.readers[s] = (_RD_BYTE, t.values)
+				elif t.kind == GHW_RTIK_TYPE_F64:
+					self.readers[s] = (_RD_F64, None)
+				elif t.kind == GHW_RTIK_TYPE_E32:
+					self.readers[s] = (_RD_SLEB, t.values)
+				else:
+					self.readers[s] = (_RD_SLEB, None)
+		return ids, p
+
+	def _signal(self, hier, name, t, p):
+		"Read the signal indices of a signal of type t and create its nets"
+		if t.kind == GHW_RTIK_SUBTYPE_RECORD or t.kind == GHW_RTIK_TYPE_RECORD:
+			for fname, ftype in t.fields:
+				p = self._signal(hier, name + '.' + fname, ftype, p)
+			return p
+
+		elif t.kind == GHW_RTIK_SUBTYPE_ARRAY:
+			el = _base(t.el)
+			if len(t.ranges) == 1 and el.kind in _ENUMS and el.is_bit:
+				left, right, _ = t.ranges[0]
+				ids, p = self._sigids(el, t.count, p)
+				self._net(hier, '%s[%d:%d]' % (name, left, right),
+					'wire', ids, _FMT_BITS, len(ids))
+				return p
+			for idx in itertools.product(*[ _indices(r) for r in t.ranges ]):
+				p = self._signal(hier,
+					'%s[%s]' % (name, ','.join(str(i) for i in idx)), t.el, p)
+			return p
+
+		elif t.kind in _ARRAYS:
+			raise GHWParseError("Unbounded signal %s.%s in %s" % \
+				(hier, name, self.file))
+
+		t = _base(t)
+		ids, p = self._sigids(t, 1, p)
+		if t.kind in _ENUMS:
+			if t.is_bit:
+				self._net(hier, name, 'wire', ids, _FMT_BITS, 1)
+			else:
+				self._net(hier, name, 'string', ids, _FMT_STRING, 1)
+		elif t.kind == GHW_RTIK_TYPE_F64:
+			self._net(hier, name, 'real', ids, _FMT_REAL, 64)
+		elif t.kind in (GHW_RTIK_TYPE_I32, GHW_RTIK_TYPE_P32):
+			self._net(hier, name, 'integer', ids, _FMT_INT, 32)
+		else:
+			self._net(hier, name, 'integer', ids, _FMT_INT, 64)
+		return p
+
+	def _net(self, hier, name, vtype, ids, fmt, size):
+		if len(ids) == 1:
+			code = str(ids[0])
+		elif ids == list(range(ids[0], ids[-1] + 1)):
+			code = '%d-%d' % (ids[0], ids[-1])
+		else:
+			code = ','.join(str(i) for i in ids)
+
+		net = {
+			'type' : vtype,
+			'name' : name,
+			'size' : str(size),
+			'hier' : hier,
+		}
+		if code not in self.sigs:
+			self.sigs[code] = { 'nets' : [] }
+			self.ids[code] = ids
+			self.fmt[code] = (fmt, size)
+		self.sigs[code]['nets'].append(net)
+
+	def list_sigs(self):
+		"Return list of full hierarchical signal names"
+		return [ n['hier'] + '.' + n['name'] \
+			for s in self.sigs.values() for n in s['nets'] ]
+
+	def lookup(self, siglist):
+		"""Return net codes of the signals given by full hierarchical name,
+wildcard pattern or compiled regular expression"""
+		select = Verilog_VCD._selector(siglist)
+		return [ c for c, s in self.sigs.items() \
+			if any(select(n['hier'] + '.' + n['name']) for n in s['nets']) ]
+
+	def _format(self, code, values):
+		fmt, size = self.fmt[code]
+		ids = self.ids[code]
+		if fmt == _FMT_BITS:
+			return ''.join(values[i] for i in ids)
+		v = values[ids[0]]
+		if fmt == _FMT_INT:
+			return format(v & ((1 << size) - 1), '0%db' % size)
+		elif fmt == _FMT_REAL:
+			return repr(v)
+		return v
+
+	def parse(self, siglist = [], t0 = None, t1 = None):
+		"""Return value changes of the signals in siglist (all if empty) in
+parse_vcd() layout, times in fs. Changes in delta cycles at the same time
+collapse into the final value. If a time window t0..t1 is given, reading
+stops at the first cycle after t1 and each 'tv' list starts with the value
+in effect at t0."""
+		if siglist:
+			codes = self.lookup(siglist)
+		else:
+			codes = list(self.sigs.keys())
+
+		data = dict((c, { 'nets' : self.sigs[c]['nets'] }) for c in codes)
+		tvs = dict((c, []) for c in codes)
+		users = {}
+		for c in codes:
+			for i in self.ids[c]:
+				users.setdefault(i, []).append(c)
+
+		buf = self.buf
+		readers = self.readers
+		values = dict((i, None) for i in readers)
+		snapshot_ids = sorted(readers)
+		f64 = struct.Struct(self.order + 'd').unpack_from
+
+		def read(i, p):
+			enc, lits = readers[i]
+			if enc == _RD_BYTE:
+				values[i] = lits[buf[p]]
+				return p + 1
+			elif enc == _RD_F64:
+				values[i] = f64(buf, p)[0]
+				return p + 8
+			v, p = _svarint(buf, p)
+			values[i] = lits[v] if lits else v
+			return p
+
+		def emit(t, changed):
+			dirty = set()
+			for i in changed:
+				dirty.update(users.get(i, ()))
+			for c in dirty:
+				v = self._format(c, values)
+				tv = tvs[c]
+				if tv and tv[-1][0] == t:
+					tv.pop()
+				if not tv or tv[-1][1] != v:
+					tv.append( (t, v) )
+
+		t = 0
+		p = self.body
+		n = len(buf)
+		while p + 4 <= n:
+			tag = bytes(buf[p:p + 4])
+			p += 4
+			if tag == b'SNP\0':
+				t = self._i64(p + 4)
+				if t1 is not None and t > t1:
+					break
+				p += 12
+				for i in snapshot_ids:
+					p = read(i, p)
+				emit(t, snapshot_ids)
+				p = self._expect(p, b'ESN\0')
+			elif tag == b'CYC\0':
+				t = self._i64(p)
+				p += 8
+				while t1 is None or t <= t1:
+					changed = []
+					i = 0
+					while True:
+						d, p = _varint(buf, p)
+						if d == 0:
+							break
+						i += d
+						p = read(i, p)
+						changed.append(i)
+					emit(t, changed)
+					d, p = _svarint(buf, p)
+					if d < 0:
+						break
+					t += d
+				else:
+					# Past the window, the rest is not needed
+					break
+				p = self._expect(p, b'ECY\0')
+			elif tag == b'DIR\0':
+				nentries = self._i32(p + 4)
+				p = self._expect(p + 8 + 8 * nentries, b'EOD\0')
+			elif tag == b'TAI\0':
+				break
+			else:
+				raise GHWParseError("Unexpected section %r in %s" % \
+					(tag, self.file))
+
+		self.end_time = t
+
+		for c in codes:
+			tv = tvs[c]
+			if t0 is not None or t1 is not None:
+				tv = _window(tv, t0, t1)
+			if tv:
+				data[c]['tv'] = tv
+
+		return data
+
+def parse_ghw(file, siglist = [], only_sigs = 0, t0 = None, t1 = None):
+	"""Parse GHW file into the data structure returned by
+Verilog_VCD.parse_vcd(), keyed by signal index range. Like parse_vcd(),
+this updates what Verilog_VCD.get_timescale() and get_endtime() return."""
+	ghw = GHWFile(file)
+	Verilog_VCD.timescale = ghw.timescale
+	if only_sigs:
+		return dict((c, { 'nets' : s['nets'] }) for c, s in ghw.sigs.items())
+	data = ghw.parse(siglist, t0, t1)
+	Verilog_VCD.endtime = ghw.end_time
+	return data
+
+def list_sigs(file):
+	"Return list of the signal names in GHW file"
+	return GHWFile(file).list_sigs()
@@ -0,0 +1,73 @@
+# Parse throughput benchmark for VCD files
+#
+# Usage:
+#
+#   python vcdbench.py [-k] trace.vcd
+#
+# Compresses the given VCD with every supported codec into a temporary
+# directory (-k: keep the files next to the original) and reports file
+# size and parse throughput of iter_vcd() for each variant, in MB of
+# uncompressed VCD per second.
+#
+
+import bz2
+import gzip
+import lzma
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from Verilog_VCD import iter_vcd
+
+CODECS = [
+	('gz', gzip.open),
+	('bz2', bz2.open),
+	('xz', lzma.open),
+]
+
+def compress(file, outdir):
+	"Create compressed copies of file, returns list of (label, path)"
+	variants = [ ('plain', file), ('plain/mmap', file) ]
+	base = os.path.join(outdir, os.path.basename(file))
+	for ext, opener in CODECS:
+		path = base + '.' + ext
+		if not os.path.exists(path):
+			with open(file, 'rb') as src, opener(path, 'wb') as dst:
+				shutil.copyfileobj(src, dst, 1 << 20)
+		variants.append( (ext, path) )
+	return variants
+
+def measure(path, use_mmap = 0):
+	"Return (seconds, number of changes) for a full parse"
+	t = time.perf_counter()
+	n = 0
+	for _ in iter_vcd(path, use_mmap = use_mmap):
+		n += 1
+	return time.perf_counter() - t, n
+
+def bench(file, outdir):
+	size = os.path.getsize(file)
+	print("%-12s %12s %7s %10s %10s" % \
+		("format", "bytes", "ratio", "seconds", "MB/s"))
+	for label, path in compress(file, outdir):
+		csize = os.path.getsize(path)
+		secs, n = measure(path, label == 'plain/mmap')
+		print("%-12s %12d %7.1f %10.2f %10.1f" % \
+			(label, csize, size / csize, secs, size / secs / 1e6))
+
+if __name__ == '__main__':
+	args = sys.argv[1:]
+	keep = '-k' in args
+	if keep:
+		args.remove('-k')
+	if len(args) != 1:
+		print("Usage: python vcdbench.py [-k] trace.vcd")
+		sys.exit(1)
+
+	if keep:
+		bench(args[0], os.path.dirname(os.path.abspath(args[0])))
+	else:
+		with tempfile.TemporaryDirectory() as d:
+			bench(args[0], d)
@@ -0,0 +1,191 @@
+# Binary cache for parsed VCD traces
+#
+# Columnar traces as returned by vcdtrace.load_vcd() are stored as
+# uncompressed .npz files in a cache directory, keyed by the VCD path,
+# size, mtime and signal filter. Re-running a notebook cell then loads
+# the arrays back instead of re-parsing the VCD.
+# The least recently used entries are evicted once the cache exceeds
+# its disk budget.
+#
+
+import hashlib
+import json
+import os
+
+import numpy
+
+import Verilog_VCD
+from vcdtrace import Trace, ClockTrace, KIND_STRING, read_traces
+
+CACHE_DIR = os.environ.get('VCD_CACHE_DIR',
+	os.path.join(os.path.expanduser('~'), '.cache', 'hdlplayground', 'vcd'))
+
+# Disk budget in bytes
+CACHE_BUDGET = 1 << 30
+
+CACHE_VERSION = 3
+
+def cache_key(file, siglist = [], opt_timescale = '', t0 = None, t1 = None):
+	"Return cache key for a VCD file, signal selection and time window"
+	st = os.stat(file)
+	# Compiled regular expressions are keyed by their pattern
+	sel = [ 're:' + s.pattern if hasattr(s, 'pattern') else s for s in siglist ]
+	ident = [ os.path.abspath(file), st.st_size, st.st_mtime_ns,
+		sorted(sel), opt_timescale, CACHE_VERSION ]
+	if t0 is not None or t1 is not None:
+		ident.append( [ t0, t1 ] )
+	return hashlib.sha1(json.dumps(ident).encode()).hexdigest()
+
+def _pack(a):
+	"Object arrays are stored as unicode arrays, avoiding pickle"
+	if a.dtype == object:
+		return a.astype(str)
+	return a
+
+def _unpack(a, kind):
+	if kind == KIND_STRING:
+		return a.astype(object)
+	return a
+
+def _store_trace(arrays, p, t):
+	arrays[p + 'time'] = t.time
+	arrays[p + 'value'] = _pack(t.value)
+	if t.unknown is not None:
+		arrays[p + 'unknown'] = t.unknown
+
+def _fetch_trace(npz, p, nets):
+	t = Trace(nets, npz[p + 'time'], None)
+	t.value = _unpack(npz[p + 'value'], t.kind)
+	if p + 'unknown' in npz:
+		t.unknown = npz[p + 'unknown']
+	return t
+
+def store(path, traces, timescale = None, endtime = None):
+	meta = {
+		'codes' : [],
+		# Times may be numpy integers, which json does not take
+		'endtime' : None if endtime is None else int(endtime),
+		'timescale' : timescale,
+	}
+	arrays = {}
+	for i, (code, t) in enumerate(traces.items()):
+		p = 'a%d_' % i
+		if isinstance(t, ClockTrace):
+			# Only the clock parameters and the irregular samples
+			clock = [ t.phase, t.period, t.duty, t.count, t.start ]
+			_store_trace(arrays, p + 'h', t.head)
+			_store_trace(arrays, p + 't', t.tail)
+		else:
+			clock = None
+			_store_trace(arrays, p, t)
+		meta['codes'].append( (code, t.nets, clock) )
+
+	arrays['meta'] = numpy.array(json.dumps(meta))
+
+	tmp = path + '.tmp%d' % os.getpid()
+	with open(tmp, 'wb') as f:
+		numpy.savez(f, **arrays)
+	os.replace(tmp, path)
+
+def fetch(path):
+	"Return (traces, timescale, endtime) of a cache entry"
+	traces = {}
+	with numpy.load(path) as npz:
+		meta = json.loads(str(npz['meta']))
+		for i, (code, nets, clock) in enumerate(meta['codes']):
+			p = 'a%d_' % i
+			if clock is not None:
+				traces[code] = ClockTrace(nets, *clock,
+					_fetch_trace(npz, p + 'h', nets),
+					_fetch_trace(npz, p + 't', nets))
+			else:
+				traces[code] = _fetch_trace(npz, p, nets)
+
+	return traces, meta['timescale'], meta['endtime']
+
+def evict(budget = None, cachedir = None):
+	"Remove least recently used cache files until within budget"
+	if budget is None:
+		budget = CACHE_BUDGET
+	if cachedir is None:
+		cachedir = CACHE_DIR
+
+	entries = []
+	for n in os.listdir(cachedir):
+		if n.endswith('.npz'):
+			p = os.path.join(cachedir, n)
+			st = os.stat(p)
+			entries.append( (st.st_mtime, st.st_size, p) )
+
+	total = sum(e[1] for e in entries)
+	for _, size, p in sorted(entries):
+		if total <= budget:
+			break
+		os.remove(p)
+		total -= size
+
+def clear(cachedir = None):
+	"Remove all cached traces"
+	evict(0, cachedir)
+
+def _fetch_used(path):
+	"""Fetch cache entry and mark it as recently used, see fetch(). None if
+missing"""
+	try:
+		entry = fetch(path)
+		os.utime(path)
+		return entry
+	except (OSError, ValueError, KeyError):
+		return None
+
+def read_cached(file, siglist = [], opt_timescale = '', cachedir = None,
+	t0 = None, t1 = None):
+	"""Like vcdtrace.read_traces(), but served from the trace cache when the
+VCD file was parsed before with the same signal selection. Returns
+(traces, timescale, endtime) without touching the Verilog_VCD module
+state, so it can be used from several threads.
+A time window t0..t1 is cut from the cached complete trace if there is
+one, otherwise only the window is parsed and cached."""
+	if cachedir is None:
+		cachedir = CACHE_DIR
+
+	path = os.path.join(cachedir,
+		cache_key(file, siglist, opt_timescale, t0, t1) + '.npz')
+
+	entry = _fetch_used(path)
+	if entry is not None:
+		return entry
+
+	if t0 is not None or t1 is not None:
+		full = _fetch_used(os.path.join(cachedir,
+			cache_key(file, siglist, opt_timescale) + '.npz'))
+		if full is not None:
+			traces, ts, end = full
+			if t1 is not None and (end is None or end > t1):
+				end = t1
+			return dict((code, t.window(t0, t1)) \
+				for code, t in traces.items()), ts, end
+
+	traces, ts, end = read_traces(file, siglist, opt_timescale, t0, t1)
+
+	try:
+		os.makedirs(cachedir, exist_ok = True)
+		store(path, traces, ts, end)
+		evict(cachedir = cachedir)
+	except OSError as e:
+		print("Warning: could not cache trace: %s" % e)
+
+	return traces, ts, end
+
+def load_vcd_cached(file, siglist = [], opt_timescale = '', cachedir = None,
+	t0 = None, t1 = None):
+	"""Like vcdtrace.load_vcd(), but served from the trace cache, see
+read_cached(). Also updates what get_timescale() and get_endtime()
+report."""
+	traces, ts, end = read_cached(file, siglist, opt_timescale, cachedir,
+		t0, t1)
+	if ts is not None:
+		Verilog_VCD.timescale = ts
+	if end is not None:
+		Verilog_VCD.endtime = end
+	return traces
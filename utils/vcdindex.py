@@ -0,0 +1,175 @@
+# Sidecar index for random access into large VCD files
+#
+# The index is built once by scanning the whole file and stored next to
+# it as '<file>.idx'. It holds the signal table from the header and
+# periodic checkpoints (byte offset of a '#' line, its time and the
+# value of every signal just before it), so a time window can be read
+# by seeking to the nearest checkpoint instead of parsing from byte 0.
+#
+
+import bisect
+import json
+import os
+
+from Verilog_VCD import BodyScanner, parse_header, split_body, \
+	_map_file, _code_table, _selector, _SPARSE_RATIO
+
+INDEX_VERSION = 1
+
+# Default distance between checkpoints in bytes
+CHECKPOINT_INTERVAL = 1 << 24
+
+def _stamp(file):
+	st = os.stat(file)
+	return st.st_size, st.st_mtime_ns
+
+class VCDIndex:
+	"""Checkpoint index of a VCD file.
+Times are in the units of the VCD $timescale."""
+
+	def __init__(self, file, interval = CHECKPOINT_INTERVAL, rebuild = False):
+		self.file = file
+		self.idxfile = file + '.idx'
+		if rebuild or not self.load():
+			self.build(interval)
+			self.save()
+
+	def load(self):
+		"Load index from sidecar file. Returns False if missing or stale"
+		try:
+			with open(self.idxfile, 'r') as f:
+				d = json.load(f)
+		except (OSError, ValueError):
+			return False
+
+		size, mtime = _stamp(self.file)
+		if d.get('version') != INDEX_VERSION or \
+			d['size'] != size or d['mtime'] != mtime:
+			return False
+
+		self.__dict__.update(d)
+		return True
+
+	def save(self):
+		d = {
+			'version' : INDEX_VERSION,
+			'size' : self.size, 'mtime' : self.mtime,
+			'mult' : self.mult, 'body' : self.body,
+			'endtime' : self.endtime,
+			'sigs' : self.sigs, 'codes' : self.codes,
+			'checkpoints' : self.checkpoints,
+		}
+		try:
+			with open(self.idxfile, 'w') as f:
+				json.dump(d, f)
+		except OSError:
+			# Read only location: keep the index in memory only
+			pass
+
+	def build(self, interval = CHECKPOINT_INTERVAL):
+		"Scan the complete VCD file and collect checkpoints"
+		self.size, self.mtime = _stamp(self.file)
+		sigs = {}
+		with open(self.file, 'rb') as fh:
+			mm = _map_file(fh)
+			mult, body = parse_header(mm, self.file, [], '', sigs)
+			codes = sorted(sigs.keys())
+			slot = dict((c, i) for i, c in enumerate(codes))
+			values = [ None ] * len(codes)
+
+			n = (len(mm) - body) // interval + 1
+			ranges = split_body(mm, body, len(mm), n)
+
+			scanner = BodyScanner(_code_table(sigs), mult)
+			checkpoints = []
+			for start, stop in ranges:
+				if start != body:
+					checkpoints.append( (start, self._time_at(mm, start, mult),
+						list(values)) )
+				for t, code, v in scanner.scan(mm, start, stop):
+					values[slot[code]] = v
+
+		self.mult = mult
+		self.body = body
+		self.endtime = scanner.time
+		self.sigs = sigs
+		self.codes = codes
+		self.checkpoints = checkpoints
+
+	@staticmethod
+	def _time_at(buf, offset, mult):
+		"Return the time of the '#' line at offset"
+		end = buf.find(b'\n', offset)
+		if end < 0:
+			end = len(buf)
+		return mult * int(buf[offset + 1:end])
+
+	def lookup(self, siglist):
+		"""Return VCD codes of the signals given by full hierarchical name,
+wildcard pattern or compiled regular expression"""
+		select = _selector(siglist)
+		codes = []
+		for code, s in self.sigs.items():
+			for n in s['nets']:
+				if select(n['hier'] + '.' + n['name']):
+					codes.append(code)
+					break
+		return codes
+
+	def read_window(self, t0, t1, siglist = []):
+		"""Return the changes between times t0 and t1 (inclusive) of the
+signals in siglist (all if empty), in the parse_vcd() layout.
+Every 'tv' list starts with the value in effect at t0."""
+
+		if siglist:
+			codes = self.lookup(siglist)
+		else:
+			codes = list(self.sigs.keys())
+
+		data = dict((c, { 'nets' : self.sigs[c]['nets'] }) for c in codes)
+
+		times = [ cp[1] for cp in self.checkpoints ]
+		i = bisect.bisect_right(times, t0) - 1
+		current = {}
+		if i >= 0:
+			offset, _, values = self.checkpoints[i]
+			slot = dict((c, j) for j, c in enumerate(self.codes))
+			for c in codes:
+				v = values[slot[c]]
+				if v is not None:
+					current[c] = v
+		else:
+			offset = self.body
+
+		with open(self.file, 'rb') as fh:
+			mm = _map_file(fh)
+			scanner = BodyScanner(_code_table(data), self.mult,
+				sparse = len(codes) * _SPARSE_RATIO <= len(self.sigs))
+			started = False
+			for t, code, v in scanner.scan(mm, offset, len(mm), until = t1):
+				if t <= t0:
+					current[code] = v
+					continue
+				if not started:
+					self._start(data, current, t0)
+					started = True
+				data[code]['tv'].append( (t, v) )
+
+		if not started:
+			self._start(data, current, t0)
+
+		for s in data.values():
+			if not s['tv']:
+				del s['tv']
+
+		return data
+
+	@staticmethod
+	def _start(data, current, t0):
+		for c, s in data.items():
+			s['tv'] = [ (t0, current[c]) ] if c in current else []
+
+def read_window(file, t0, t1, siglist = []):
+	"""Read time window t0..t1 of VCD file, using (and building, if
+necessary) the sidecar index"""
+	return VCDIndex(file).read_window(t0, t1, siglist)
@@ -0,0 +1,254 @@
+# Multi-resolution summaries of traces for zoomable waveform views
+#
+# For every signal a pyramid of time buckets is built once from the
+# parsed trace: level j has buckets of 2^(kmin + j) time units, starting
+# at time 0, each holding the number of changes in the bucket and the
+# last, smallest and largest value (the first value of a bucket is the
+# last of the one before). Every level has half the buckets of the one
+# below, so a view of any zoom level picks the level matching its pixel
+# width and is drawn in O(pixels) from the pyramid alone, without the
+# changes of the trace.
+#
+# The pyramids of a trace file are stored next to it as '<file>.pyr.npz',
+# keyed by its size and mtime like the vcdindex sidecar. Times are in the
+# timescale of the file.
+#
+
+import json
+import math
+import os
+
+import numpy
+
+from vcdtrace import Trace, ClockTrace, KIND_BITS, KIND_REAL
+from vcdcache import read_cached
+
+PYRAMID_VERSION = 2
+
+# Average number of changes per bucket of the finest level
+BUCKET_CHANGES = 4
+
+def _stamp(file):
+	st = os.stat(file)
+	return st.st_size, st.st_mtime_ns
+
+def _pairs(a, pad):
+	"Pad array a to even length with 'pad' and return its halves"
+	if len(a) & 1:
+		a = numpy.append(a, numpy.array([ pad ], dtype = a.dtype))
+	return a[0::2], a[1::2]
+
+class Pyramid:
+	"""Summary of one Trace with the nets 'nets' and changes from time
+'start' to 'end'. 'levels' is a list of dicts of arrays, one entry per
+bucket: 'count' (number of changes) and, for bit vectors up to 64 bits
+and reals, 'last' (the value at its end), 'min' and 'max' (of the value
+plane, including the value entering the bucket), plus 'unknown' (the
+unknown plane of 'last') for bit vectors with x or z bits. Up to the
+first change, the values are those of the first change."""
+
+	def __init__(self, nets, start, end, kmin, levels):
+		self.nets = nets
+		self.start = start
+		self.end = end
+		self.kmin = kmin
+		self.levels = levels
+		self._cums = {}
+
+	@classmethod
+	def build(cls, trace):
+		"Return the Pyramid of a Trace, None for empty and ClockTraces"
+		if isinstance(trace, ClockTrace) or not len(trace):
+			return None
+
+		time = trace.time
+		n = len(time)
+		span = max(float(time[-1]), 1.0)
+		kmin = max(0, math.ceil(math.log2(span * BUCKET_CHANGES / n)))
+		b = (time // (1 << kmin)).astype(numpy.int64)
+		count = numpy.bincount(b)
+		level = { 'count' : count }
+
+		if trace.kind == KIND_REAL or \
+			(trace.kind == KIND_BITS and trace.value.ndim == 1):
+			v = trace.value
+			cum = numpy.cumsum(count)
+			# Index of the last change at the end of, and before each bucket
+			end = cum - 1
+			before = end - count
+			# The value entering the bucket and the changes in it
+			lo, hi = v[before.clip(0)], v[before.clip(0)]
+			busy = numpy.flatnonzero(count)
+			starts = (cum - count)[busy]
+			lo[busy] = numpy.minimum(lo[busy], numpy.minimum.reduceat(v, starts))
+			hi[busy] = numpy.maximum(hi[busy], numpy.maximum.reduceat(v, starts))
+			level.update(last = v[end.clip(0)], min = lo, max = hi)
+			if trace.unknown is not None:
+				level['unknown'] = trace.unknown[end.clip(0)]
+
+		levels = [ level ]
+		while len(level['count']) > 1:
+			level = cls._coarser(level)
+			levels.append(level)
+		return cls(trace.nets, time[0].item(), time[-1].item(), kmin, levels)
+
+	@staticmethod
+	def _coarser(level):
+		"Merge pairs of buckets"
+		c0, c1 = _pairs(level['count'], 0)
+		up = { 'count' : c0 + c1 }
+		if 'last' in level:
+			end = level['last'][-1]
+			up['last'] = _pairs(level['last'], end)[1]
+			up['min'] = numpy.minimum(*_pairs(level['min'], end))
+			up['max'] = numpy.maximum(*_pairs(level['max'], end))
+		if 'unknown' in level:
+			up['unknown'] = _pairs(level['unknown'], level['unknown'][-1])[1]
+		return up
+
+	@property
+	def values(self):
+		"True if the levels hold values besides the counts"
+		return 'last' in self.levels[0]
+
+	def level(self, dt):
+		"Index of the coarsest level with buckets not longer than dt, or None"
+		if dt < (1 << self.kmin):
+			return None
+		j = int(math.floor(math.log2(dt))) - self.kmin
+		return min(j, len(self.levels) - 1)
+
+	def bucket(self, j):
+		"Time span of the buckets of level j"
+		return 1 << (self.kmin + j)
+
+	def _cum(self, j):
+		"Number of changes before each bucket of level j, plus the total"
+		if j not in self._cums:
+			self._cums[j] = numpy.concatenate(([ 0 ],
+				numpy.cumsum(self.levels[j]['count'])))
+		return self._cums[j]
+
+	def _edges(self, t0, dt, width):
+		"Level and bucket index of the width + 1 column edges t0 + i * dt"
+		j = self.level(dt)
+		if j is None:
+			return None, None
+		n = len(self.levels[j]['count'])
+		edges = t0 + dt * numpy.arange(width + 1)
+		b = numpy.floor(edges / self.bucket(j)).clip(0, n)
+		return j, b.astype(numpy.int64)
+
+	def bounds(self, t0, dt, width):
+		"""Return the number of changes before each of the width + 1 column
+edges t0 + i * dt, or None if dt is below the finest level. Edges are
+rounded down to the start of their bucket, so bounds[0] - 1 is the index
+of the sample in effect there, and the column holding sample i is found
+by searchsorted(bounds, i, 'right') - 1."""
+		j, b = self._edges(t0, dt, width)
+		if j is None:
+			return None
+		return self._cum(j)[b]
+
+	def sample(self, t0, dt, width):
+		"""Return a Trace of the values in effect at the column edges of
+bounds(), one sample per edge at the edge time, or None if dt is below
+the finest level. Edges before the first change get an arbitrary value.
+Requires values."""
+		j, b = self._edges(t0, dt, width)
+		if j is None:
+			return None
+		level = self.levels[j]
+		i = (b - 1).clip(0)
+		u = level['unknown'][i] if 'unknown' in level else None
+		return Trace(self.nets, t0 + dt * numpy.arange(width + 1),
+			level['last'][i], u)
+
+	def extremes(self, t0, dt, width):
+		"""Return the smallest and largest value in each of the 'width'
+columns of bounds(), including the value entering the column, or None if
+dt is below the finest level. Requires values."""
+		j, b = self._edges(t0, dt, width)
+		if j is None:
+			return None
+		level = self.levels[j]
+		# Column c covers the buckets b[c] up to b[c + 1] - 1, or is within
+		# bucket b[c], which reduceat() then returns on its own. Past the
+		# last bucket the last value stays.
+		end = level['last'][-1:]
+		lo = numpy.minimum.reduceat(numpy.concatenate((level['min'], end)), b)
+		hi = numpy.maximum.reduceat(numpy.concatenate((level['max'], end)), b)
+		return lo[:-1], hi[:-1]
+
+def build(traces):
+	"Return the Pyramids of a dict of Traces, by the same keys"
+	return dict((code, Pyramid.build(t)) for code, t in traces.items())
+
+def save(path, pyramids, stamp):
+	meta = { 'version' : PYRAMID_VERSION, 'stamp' : list(stamp), 'codes' : [] }
+	arrays = {}
+	for i, (code, p) in enumerate(pyramids.items()):
+		if p is None:
+			meta['codes'].append( (code, None) )
+			continue
+		meta['codes'].append( (code, [ p.nets, p.start, p.end, p.kmin,
+			len(p.levels) ]) )
+		for j, level in enumerate(p.levels):
+			for k, a in level.items():
+				arrays['p%d_%d_%s' % (i, j, k)] = a
+
+	arrays['meta'] = numpy.array(json.dumps(meta))
+	tmp = path + '.tmp%d' % os.getpid()
+	with open(tmp, 'wb') as f:
+		numpy.savez(f, **arrays)
+	os.replace(tmp, path)
+
+def load(path, stamp):
+	"Load pyramids from 'path', None if missing or stale"
+	try:
+		with numpy.load(path) as npz:
+			meta = json.loads(str(npz['meta']))
+			if meta['version'] != PYRAMID_VERSION or \
+				tuple(meta['stamp']) != tuple(stamp):
+				return None
+			# The array names of each level, by the 'p<i>_<j>_' prefix of save()
+			fields = {}
+			for k in npz.files:
+				if k != 'meta':
+					i, j, field = k[1:].split('_', 2)
+					fields.setdefault( (int(i), int(j)), []).append(field)
+			pyramids = {}
+			for i, (code, params) in enumerate(meta['codes']):
+				if params is None:
+					pyramids[code] = None
+					continue
+				nets, start, end, kmin, n = params
+				levels = []
+				for j in range(n):
+					levels.append(dict((k, npz['p%d_%d_%s' % (i, j, k)]) \
+						for k in fields.get( (i, j), [])))
+				pyramids[code] = Pyramid(nets, start, end, kmin, levels)
+			return pyramids
+	except (OSError, ValueError, KeyError):
+		return None
+
+def load_pyramids(file, traces = None, rebuild = False):
+	"""Return the Pyramids of all signals of a trace file, keyed like
+load_vcd(). They are read from the '<file>.pyr.npz' sidecar, or built from
+'traces' (by default the complete trace, see vcdcache) and saved there."""
+	path = file + '.pyr.npz'
+	stamp = _stamp(file)
+	if not rebuild:
+		pyramids = load(path, stamp)
+		if pyramids is not None:
+			return pyramids
+
+	if traces is None:
+		traces = read_cached(file)[0]
+	pyramids = build(traces)
+	try:
+		save(path, pyramids, stamp)
+	except OSError:
+		# Read only location: keep the pyramids in memory only
+		pass
+	return pyramids
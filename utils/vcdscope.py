@@ -0,0 +1,165 @@
+# Scope tree index of the signals in a waveform header
+#
+# Only the header of the trace is parsed, into a tree of scopes where
+# every scope holds its child scopes and its variables in dicts. Signal
+# listings, exact and wildcard lookups then walk the tree instead of
+# scanning a flat list of all nets, which matters for large designs with
+# hundreds of thousands of (aliased) nets.
+#
+# Indexes are cached in memory, keyed by file path, size and mtime.
+#
+# Wildcards are '*' (any sequence, dots included) and '?' (any single
+# character), the same as in the siglist of parse_vcd(); brackets are
+# taken literally, so vector names like 'data[7:0]' can be used in
+# patterns as they are.
+#
+
+import os
+
+from Verilog_VCD import iter_vcd, _wildcard
+from fstreader import is_fst, parse_fst
+from ghwreader import is_ghw, parse_ghw
+
+# In memory cache of the indexes: path -> (stamp, index)
+_indexes = {}
+
+class Scope:
+	"Node of the scope tree"
+	__slots__ = [ 'path', 'scopes', 'vars' ]
+
+	def __init__(self, path):
+		self.path = path
+		self.scopes = {}  # name -> Scope
+		self.vars = {}    # name -> (code, net)
+
+	def child(self, name):
+		s = self.scopes.get(name)
+		if s is None:
+			path = self.path + '.' + name if self.path else name
+			s = self.scopes[name] = Scope(path)
+		return s
+
+	def walk(self):
+		"Yield this scope and all scopes below, depth first"
+		yield self
+		for s in self.scopes.values():
+			yield from s.walk()
+
+	def names(self):
+		"Full names of the variables in this scope"
+		return [ self.path + '.' + n for n in self.vars ]
+
+def _is_pattern(s):
+	return '*' in s or '?' in s
+
+class SignalIndex:
+	"""Scope tree of the signals of a trace.
+Built from the parse_vcd() data layout (only the 'nets' are used)."""
+
+	def __init__(self, sigs):
+		self.sigs = sigs
+		self.root = Scope('')
+		self.names = []
+		nodes = { '' : self.root } # Scope by path, while building
+		for code, s in sigs.items():
+			for net in s['nets']:
+				hier = net['hier']
+				node = nodes.get(hier)
+				if node is None:
+					node = nodes[hier] = self._scope_at(hier)
+				node.vars[net['name']] = (code, net)
+				self.names.append(hier + '.' + net['name'])
+
+	def _scope_at(self, path):
+		node = self.root
+		for name in path.split('.'):
+			node = node.child(name)
+		return node
+
+	def list_sigs(self):
+		"Return list of full signal names, in the order of list_sigs()"
+		return list(self.names)
+
+	def scope(self, path):
+		"Return the Scope at hierarchical path, or None"
+		node = self.root
+		if path:
+			for name in path.split('.'):
+				node = node.scopes.get(name)
+				if node is None:
+					return None
+		return node
+
+	def subtree(self, path = ''):
+		"Return full names of all signals in and below scope path"
+		node = self.scope(path)
+		if node is None:
+			return []
+		return [ n for s in node.walk() for n in s.names() ]
+
+	def var(self, name):
+		"Return (code, net) of a signal given by full name, or None"
+		hier, _, leaf = name.rpartition('.')
+		while True:
+			node = self.scope(hier)
+			if node is not None and leaf in node.vars:
+				return node.vars[leaf]
+			# Variable names may contain dots themselves (GHW records)
+			if not hier:
+				return None
+			hier, _, head = hier.rpartition('.')
+			leaf = head + '.' + leaf
+
+	def glob(self, pattern):
+		"""Return full names of the signals matching the wildcard pattern,
+for example 'top.ram*.a_*'. Only the subtree of the scope named by the
+literal start of the pattern is searched."""
+		if not _is_pattern(pattern):
+			return [ pattern ] if self.var(pattern) is not None else []
+		m = _wildcard(pattern).match
+		i = min(p for p in (pattern.find('*'), pattern.find('?')) if p >= 0)
+		path = pattern[:i].rpartition('.')[0]
+		node = self.scope(path)
+		# Variable names may contain dots themselves (GHW records)
+		while node is None:
+			path = path.rpartition('.')[0]
+			node = self.scope(path)
+		return [ n for s in node.walk() for n in s.names() if m(n) ]
+
+	def codes(self, patterns):
+		"""Return the codes of the signals matching any of the given names
+or wildcard patterns, without duplicates"""
+		codes = dict.fromkeys(self.var(name)[0] \
+			for pattern in patterns for name in self.glob(pattern))
+		return list(codes)
+
+def _header(file):
+	"Parse only the signal definitions of a trace file"
+	if is_fst(file):
+		return parse_fst(file, only_sigs = 1)
+	if is_ghw(file):
+		return parse_ghw(file, only_sigs = 1)
+	sigs = {}
+	for _ in iter_vcd(file, sigs = sigs, only_sigs = 1, use_mmap = 1):
+		pass
+	return sigs
+
+def load_index(file):
+	"Return the SignalIndex of a trace file, from cache if possible"
+	st = os.stat(file)
+	stamp = (st.st_size, st.st_mtime_ns)
+	key = os.path.abspath(file)
+	if key in _indexes and _indexes[key][0] == stamp:
+		return _indexes[key][1]
+
+	index = SignalIndex(_header(file))
+	_indexes[key] = (stamp, index)
+	return index
+
+def list_sigs(file):
+	"Return list of the signal names in a trace file"
+	return load_index(file).list_sigs()
+
+def glob_sigs(file, pattern):
+	"Return the signal names in a trace file matching a wildcard pattern"
+	return load_index(file).glob(pattern)
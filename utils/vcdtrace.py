@@ -0,0 +1,728 @@
+# Columnar storage of parsed VCD traces
+#
+# Instead of a list of (time, value) tuples, every signal history is kept
+# as a set of numpy arrays: one int64 time column plus value columns
+# depending on the signal kind:
+#
+#   'bits'   : up to 64 bits; unsigned value array plus an unknown mask
+#              (only allocated once a 4-state value shows up)
+#   'wide'   : more than 64 bits; same layout, packed into rows of
+#              little endian uint64 words, least significant word first
+#   'real'   : float64 values
+#   'string' : object array of strings (GHDL enums, etc.)
+#
+# 4-state bit vectors are stored as two bit planes. A bit set in the
+# unknown mask marks the bit as x or z: then the value bit tells which,
+# 0 is x and 1 is z. Values are decoded once while parsing; comparisons,
+# hex formatting and x checks work on the planes directly.
+#
+# Strictly periodic 1 bit signals (clocks) are detected when the trace is
+# built and kept as a ClockTrace: phase, period, duty and edge count, plus
+# the irregular samples before and after the periodic run. The plain
+# arrays are only expanded when the raw history is asked for.
+#
+
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy
+
+import Verilog_VCD
+from Verilog_VCD import VCDFile, split_timescale, time_factor
+from fstreader import is_fst, FSTFile
+from ghwreader import is_ghw, GHWFile
+
+KIND_BITS   = 'bits'
+KIND_WIDE   = 'wide'
+KIND_REAL   = 'real'
+KIND_STRING = 'string'
+
+# Translation tables for 4-state binary strings. Anything weak or
+# uninitialized (GHDL 'U', 'W', '-') counts as 'x', 'H'/'L' as 1/0.
+_X_CHARS = 'xXuUwW-'
+_Z_CHARS = 'zZ'
+
+def _table(one):
+	t = {}
+	for c in '01' + _X_CHARS + _Z_CHARS + 'hHlL':
+		t[ord(c)] = '1' if c in one else '0'
+	return t
+
+_TO_VAL     = _table('1hH' + _Z_CHARS)
+_TO_UNKNOWN = _table(_X_CHARS + _Z_CHARS)
+
+def kind_of(vtype, size):
+	"Determine storage kind from VCD var type and size"
+	if vtype in ('real', 'realtime'):
+		return KIND_REAL
+	elif vtype == 'string':
+		return KIND_STRING
+	elif size <= 64:
+		return KIND_BITS
+	else:
+		return KIND_WIDE
+
+def decode_bits(s, size):
+	"""Decode a VCD binary value string into (value, unknown) bit planes.
+Shorter strings are left extended according to the VCD rules."""
+	try:
+		return int(s, 2), 0
+	except ValueError:
+		pass
+
+	try:
+		v = int(s.translate(_TO_VAL), 2)
+		u = int(s.translate(_TO_UNKNOWN), 2)
+	except ValueError:
+		# Not a binary value at all, treat as unknown
+		return 0, (1 << size) - 1
+
+	n = len(s)
+	if n < size:
+		ext = ((1 << (size - n)) - 1) << n
+		if s[0] in _X_CHARS:
+			u |= ext
+		elif s[0] in _Z_CHARS:
+			u |= ext
+			v |= ext
+	return v, u
+
+def encode_bits(v, u, size):
+	"Inverse of decode_bits(): return binary string of 'size' digits"
+	fmt = '0%db' % size
+	s = format(v, fmt)
+	if not u:
+		return s
+	us = format(u, fmt)
+	return ''.join(('z' if c == '1' else 'x') if m == '1' else c \
+		for c, m in zip(s, us))
+
+def format_hex(v, u, size):
+	"""Return hex string of 'size' bits. Nibbles that are all x or z
+print as 'x' or 'z', partly unknown ones as 'X' or 'Z'."""
+	digits = (size + 3) // 4
+	fmt = '0%dx' % digits
+	s = format(v, fmt)
+	if not u:
+		return s
+	xs = format(u & ~v, fmt)
+	zs = format(u & v, fmt)
+	top = '%x' % ((1 << (size - 4 * (digits - 1))) - 1)
+	out = []
+	for i, (c, x, z) in enumerate(zip(s, xs, zs)):
+		full = top if i == 0 else 'f'
+		if x != '0':
+			out.append('x' if x == full else 'X')
+		elif z != '0':
+			out.append('z' if z == full else 'Z')
+		else:
+			out.append(c)
+	return ''.join(out)
+
+def _words(size):
+	"Number of uint64 words of a wide value"
+	return (size + 63) // 64
+
+def _uint_typecode(size):
+	for tc in 'BHIQ':
+		if array(tc).itemsize * 8 >= size:
+			return tc
+	return 'Q'
+
+class Trace:
+	"""Columnar value history of a single VCD signal (identifier code).
+Indexing returns (time, value string) tuples, like the 'tv' list of
+parse_vcd(), so a Trace can be used wherever such a list is expected.
+For bit vectors, packed(), same(), has_x() and hex_str() work on the
+stored bit planes without building the value string."""
+
+	__slots__ = [ 'nets', 'size', 'type', 'kind',
+		'time', 'value', 'unknown' ]
+
+	def __init__(self, nets, time, value, unknown = None):
+		self.nets = nets
+		net = nets[0]
+		self.size = int(net['size'])
+		self.type = net['type']
+		self.kind = kind_of(self.type, self.size)
+		self.time = time
+		self.value = value
+		self.unknown = unknown
+
+	@classmethod
+	def from_tv(cls, nets, tv):
+		"Create Trace from a parse_vcd() style list of (time, value)"
+		b = _Builder(nets)
+		for t, v in tv:
+			b.add(t, v)
+		return b.finish()
+
+	def __len__(self):
+		return len(self.time)
+
+	def __iter__(self):
+		for i in range(len(self.time)):
+			yield self[i]
+
+	def __getitem__(self, i):
+		return (self.time[i].item(), self.value_str(i))
+
+	def packed(self, i):
+		"Return (value, unknown) bit planes at index i as integers"
+		if self.kind == KIND_WIDE:
+			v = int.from_bytes(self.value[i].tobytes(), 'little')
+			if self.unknown is None:
+				return v, 0
+			return v, int.from_bytes(self.unknown[i].tobytes(), 'little')
+		v = int(self.value[i])
+		return v, int(self.unknown[i]) if self.unknown is not None else 0
+
+	def has_x(self, i):
+		"True if any bit of the value at index i is x or z"
+		if self.unknown is None:
+			return False
+		return bool(self.unknown[i].any())
+
+	def same(self, i, j):
+		"True if the values at indices i and j are equal, x and z included"
+		if self.kind == KIND_BITS or self.kind == KIND_WIDE:
+			if not numpy.array_equal(self.value[i], self.value[j]):
+				return False
+			return self.unknown is None or \
+				numpy.array_equal(self.unknown[i], self.unknown[j])
+		return self.value[i] == self.value[j]
+
+	def changes(self):
+		"""Return bool array, True where the value differs from the one
+before. The first entry is always True."""
+		n = len(self.time)
+		d = numpy.ones(n, dtype = bool)
+		if n < 2:
+			return d
+		if self.kind == KIND_BITS or self.kind == KIND_WIDE:
+			planes = [ self.value ]
+			if self.unknown is not None:
+				planes.append(self.unknown)
+			d[1:] = False
+			for p in planes:
+				ne = p[1:] != p[:-1]
+				d[1:] |= ne.any(axis = 1) if ne.ndim > 1 else ne
+		else:
+			d[1:] = self.value[1:] != self.value[:-1]
+		return d
+
+	def hex_str(self, i):
+		"Return the value at index i as hex string, see format_hex()"
+		v, u = self.packed(i)
+		return format_hex(v, u, self.size)
+
+	def value_str(self, i):
+		"Return the value at index i as VCD style string"
+		if self.kind == KIND_BITS or self.kind == KIND_WIDE:
+			v, u = self.packed(i)
+			return encode_bits(v, u, self.size)
+		elif self.kind == KIND_REAL:
+			return repr(float(self.value[i]))
+		else:
+			return self.value[i]
+
+	def tv(self):
+		"Return history as parse_vcd() compatible list"
+		return list(self)
+
+	def index(self, t):
+		"Return the number of samples at or before time t"
+		return int(numpy.searchsorted(self.time, t, 'right'))
+
+	def indices(self, t):
+		"index() of every time in the array t"
+		return numpy.searchsorted(self.time, t, 'right')
+
+	def planes(self, i):
+		"""Return the value and unknown planes (None if all known) of the
+samples with the indices in array i"""
+		u = self.unknown[i] if self.unknown is not None else None
+		return self.value[i], u
+
+	def _slice(self, i, j):
+		"Samples i to j - 1 as plain Trace"
+		u = self.unknown[i:j] if self.unknown is not None else None
+		return Trace(self.nets, self.time[i:j], self.value[i:j], u)
+
+	def window(self, t0 = None, t1 = None):
+		"""Return the samples between times t0 and t1 (inclusive, None for
+open ends) as new Trace. Like the time windows of vcdindex, it starts
+with the value in effect at t0, if any."""
+		i = 0 if t0 is None else max(self.index(t0) - 1, 0)
+		j = len(self) if t1 is None else max(self.index(t1), i)
+		w = self._slice(i, j)
+		if t0 is not None and len(w) and w.time[0] < t0:
+			w.time = w.time.copy()
+			w.time[0] = t0
+		return detect_clock(w)
+
+	@property
+	def name(self):
+		net = self.nets[0]
+		return net['hier'] + '.' + net['name']
+
+	@property
+	def nbytes(self):
+		n = self.time.nbytes + self.value.nbytes
+		if self.unknown is not None:
+			n += self.unknown.nbytes
+		return n
+
+	def __repr__(self):
+		return "<Trace %s: %s[%d], %d changes>" % \
+			(self.name, self.kind, self.size, len(self))
+
+# Minimum number of edges for a signal to be stored as ClockTrace
+CLOCK_MIN_EDGES = 64
+
+class ClockTrace(Trace):
+	"""Trace of a strictly periodic single bit signal, stored analytically:
+'count' edges, the first at time 'phase' with value 'start' (0 or 1),
+'duty' later the second, one 'period' later the third, and so on.
+Irregular samples before and after, e.g. an initial 'x', are kept as
+the plain Traces 'head' and 'tail'. Indexing and iteration compute the
+samples on the fly; the time, value and unknown arrays are only built
+(once) when accessed."""
+
+	__slots__ = [ 'phase', 'period', 'duty', 'count', 'start',
+		'head', 'tail', '_plain' ]
+
+	def __init__(self, nets, phase, period, duty, count, start, head, tail):
+		self.nets = nets
+		net = nets[0]
+		self.size = int(net['size'])
+		self.type = net['type']
+		self.kind = kind_of(self.type, self.size)
+		self.phase = phase
+		self.period = period
+		self.duty = duty
+		self.count = count
+		self.start = start
+		self.head = head
+		self.tail = tail
+		self._plain = None
+
+	def __reduce__(self):
+		"Pickle the analytic form, without the expanded arrays"
+		return (ClockTrace, (self.nets, self.phase, self.period, self.duty,
+			self.count, self.start, self.head, self.tail))
+
+	def edge_time(self, k):
+		"Time of the k-th periodic edge"
+		return self.phase + (k >> 1) * self.period + (k & 1) * self.duty
+
+	@property
+	def last(self):
+		"Time of the last periodic edge"
+		return self.edge_time(self.count - 1)
+
+	def __len__(self):
+		return len(self.head) + self.count + len(self.tail)
+
+	def __getitem__(self, i):
+		if i < 0:
+			i += len(self)
+		nh = len(self.head)
+		if i < nh:
+			return self.head[i]
+		k = i - nh
+		if k < self.count:
+			return (self.edge_time(k), '01'[self.start ^ (k & 1)])
+		return self.tail[k - self.count]
+
+	def __iter__(self):
+		yield from self.head
+		t = self.phase
+		v = self.start
+		steps = (self.duty, self.period - self.duty)
+		for k in range(self.count):
+			yield (t, '01'[v])
+			t += steps[k & 1]
+			v ^= 1
+		yield from self.tail
+
+	def value_str(self, i):
+		return self[i][1]
+
+	def edge_times(self, level = None):
+		"""Return the times of the samples changing to 'level' (0 or 1), or of
+all samples with level None, without expanding the trace"""
+		def hits(p):
+			if level is None:
+				return p.time
+			hit = p.value == level
+			if p.unknown is not None:
+				hit &= p.unknown == 0
+			return p.time[hit]
+
+		if level is None:
+			k = numpy.arange(self.count, dtype = numpy.int64)
+		else:
+			k = numpy.arange((self.start ^ level) & 1, self.count, 2,
+				dtype = numpy.int64)
+		t = self.phase + (k >> 1) * self.period + (k & 1) * self.duty
+		return numpy.concatenate((hits(self.head), t, hits(self.tail)))
+
+	def index(self, t):
+		if t < self.phase:
+			return self.head.index(t)
+		q, r = divmod(t - self.phase, self.period)
+		k = 2 * int(q) + 1 + (r >= self.duty)
+		if k < self.count:
+			return len(self.head) + k
+		return len(self.head) + self.count + self.tail.index(t)
+
+	def indices(self, t):
+		t = numpy.asarray(t)
+		nh = len(self.head)
+		i = self.head.indices(t)
+		if self.count:
+			q, r = numpy.divmod(t - self.phase, self.period)
+			k = numpy.minimum(2 * q + 1 + (r >= self.duty), self.count)
+			i = numpy.where(t >= self.phase, nh + k, i)
+		n = self.tail.indices(t)
+		return numpy.where(n > 0, nh + self.count + n, i)
+
+	def planes(self, i):
+		i = numpy.asarray(i, dtype = numpy.int64)
+		nh = len(self.head)
+		e = nh + self.count
+		v = (self.start ^ ((i - nh) & 1)).astype(self.head.value.dtype)
+		u = None
+		for p, sel, off in ((self.head, i < nh, 0), (self.tail, i >= e, e)):
+			if not sel.any():
+				continue
+			v[sel] = p.value[i[sel] - off]
+			if p.unknown is not None:
+				if u is None:
+					u = numpy.zeros_like(v)
+				u[sel] = p.unknown[i[sel] - off]
+		return v, u
+
+	def _slice(self, i, j):
+		nh = len(self.head)
+		clip = lambda x, n: min(max(x, 0), n)
+		head = self.head._slice(clip(i, nh), clip(j, nh))
+		k0, k1 = clip(i - nh, self.count), clip(j - nh, self.count)
+		e = self.count + nh
+		tail = self.tail._slice(clip(i - e, len(self.tail)),
+			clip(j - e, len(self.tail)))
+
+		k = numpy.arange(k0, k1, dtype = numpy.int64)
+		t = self.phase + (k >> 1) * self.period + (k & 1) * self.duty
+		v = (self.start ^ (k & 1)).astype(self.head.value.dtype)
+		time = numpy.concatenate((head.time, t, tail.time))
+		value = numpy.concatenate((head.value, v, tail.value))
+		unknown = None
+		if head.unknown is not None or tail.unknown is not None:
+			masks = [ p.unknown if p.unknown is not None \
+				else numpy.zeros_like(p.value) for p in (head, tail) ]
+			unknown = numpy.concatenate((masks[0], numpy.zeros_like(v),
+				masks[1]))
+		return Trace(self.nets, time, value, unknown)
+
+	def expand(self):
+		"Return the history as plain Trace"
+		if self._plain is None:
+			self._plain = self._slice(0, len(self))
+		return self._plain
+
+	@property
+	def time(self):
+		return self.expand().time
+
+	@property
+	def value(self):
+		return self.expand().value
+
+	@property
+	def unknown(self):
+		return self.expand().unknown
+
+	@property
+	def nbytes(self):
+		return self.head.nbytes + self.tail.nbytes
+
+	def __repr__(self):
+		return "<ClockTrace %s: period %d, duty %d, %d changes>" % \
+			(self.name, self.period, self.duty, len(self))
+
+def _periodic_run(time, value, unknown):
+	"""Return the number of samples from the start of the arrays that
+alternate in value with alternating, positive time steps"""
+	n = len(time)
+	if n < 3 or (unknown is not None and unknown[0]):
+		return min(n, 1)
+	d = numpy.diff(time)
+	if d[0] <= 0 or d[1] <= 0:
+		return 1
+	ok = value[1:] != value[:-1]
+	if unknown is not None:
+		ok &= unknown[1:] == 0
+	ok[0::2] &= d[0::2] == d[0]
+	ok[1::2] &= d[1::2] == d[1]
+	bad = numpy.flatnonzero(~ok)
+	return int(bad[0]) + 1 if len(bad) else n
+
+def detect_clock(trace):
+	"""Return a ClockTrace if 'trace' is a single bit signal that is
+strictly periodic for most of its history, otherwise 'trace' itself"""
+	n = len(trace)
+	if trace.kind != KIND_BITS or trace.size != 1 or n < CLOCK_MIN_EDGES:
+		return trace
+
+	time, value, unknown = trace.time, trace.value, trace.unknown
+	best = (0, 0)
+	# The periodic part may start after a few samples (initial x, reset)
+	for i in range(4):
+		u = unknown[i:] if unknown is not None else None
+		run = _periodic_run(time[i:], value[i:], u)
+		if run > best[1]:
+			best = (i, run)
+		if i + run >= n - 4:
+			break
+
+	i, run = best
+	if run < CLOCK_MIN_EDGES or run < n // 2:
+		return trace
+
+	def part(a, b):
+		u = unknown[a:b].copy() if unknown is not None else None
+		return Trace(trace.nets, time[a:b].copy(), value[a:b].copy(), u)
+
+	return ClockTrace(trace.nets, int(time[i]), int(time[i + 2] - time[i]),
+		int(time[i + 1] - time[i]), run, int(value[i]),
+		part(0, i), part(i + run, n))
+
+class _Builder:
+	"Accumulates a Trace in compact arrays while parsing"
+	def __init__(self, nets):
+		net = nets[0]
+		self.nets = nets
+		self.size = int(net['size'])
+		self.kind = kind_of(net['type'], self.size)
+		self.time = array('q')
+		self.unknown = None
+		if self.kind == KIND_BITS:
+			self.tc = _uint_typecode(self.size)
+			self.value = array(self.tc)
+			self.add = self.add_bits
+		elif self.kind == KIND_WIDE:
+			# Rows of little endian words, appended as bytes
+			self.nbytes = _words(self.size) * 8
+			self.full = (1 << self.size) - 1
+			self.value = bytearray()
+			self.add = self.add_wide
+		elif self.kind == KIND_REAL:
+			self.value = array('d')
+			self.add = self.add_real
+		else:
+			self.value = []
+			self.add = self.add_string
+
+	def add_bits(self, t, v):
+		self.time.append(t)
+		v, u = decode_bits(v, self.size)
+		if u and self.unknown is None:
+			n = len(self.value)
+			self.unknown = array(self.tc, bytes(n * self.value.itemsize))
+		self.value.append(v)
+		if self.unknown is not None:
+			self.unknown.append(u)
+
+	def add_wide(self, t, v):
+		self.time.append(t)
+		v, u = decode_bits(v, self.size)
+		if u and self.unknown is None:
+			self.unknown = bytearray(len(self.value))
+		self.value += (v & self.full).to_bytes(self.nbytes, 'little')
+		if self.unknown is not None:
+			self.unknown += (u & self.full).to_bytes(self.nbytes, 'little')
+
+	def add_real(self, t, v):
+		self.time.append(t)
+		try:
+			self.value.append(float(v))
+		except ValueError:
+			self.value.append(float('nan'))
+
+	def add_string(self, t, v):
+		self.time.append(t)
+		self.value.append(v)
+
+	def _column(self, a):
+		if isinstance(a, bytearray):
+			col = numpy.frombuffer(a, dtype = '<u8')
+			return col.reshape(-1, self.nbytes // 8)
+		if isinstance(a, array):
+			if a.typecode == 'd':
+				return numpy.frombuffer(a, dtype = numpy.float64)
+			elif a.typecode == 'q':
+				return numpy.frombuffer(a, dtype = numpy.int64)
+			return numpy.frombuffer(a, dtype = 'u%d' % a.itemsize)
+		col = numpy.empty(len(a), dtype = object)
+		col[:] = a
+		return col
+
+	def finish(self):
+		c = self._column
+		u = c(self.unknown) if self.unknown is not None else None
+		return detect_clock(Trace(self.nets, c(self.time), c(self.value), u))
+
+_INT64_MAX = (1 << 63) - 1
+
+def rescale(time, timescale, units):
+	"""Convert a time column from 'timescale' (e.g. '10ns') to 'units'.
+The result is exact int64 for the same or finer units, float64 for
+coarser ones, where times generally aren't integers anymore."""
+	num, den = time_factor(timescale, units)
+	if den != 1:
+		return time.astype(numpy.float64) * num / den
+	if num == 1:
+		return time
+	if len(time) and int(abs(time).max()) > _INT64_MAX // num:
+		raise OverflowError("Times exceed int64 in units of %s" % units)
+	return time * num
+
+def rescale_traces(traces, units):
+	"""Rescale all traces in place from the timescale of the last parsed
+file to 'units' (s, ms, us, ns, ps, fs). Updates what get_timescale()
+and get_endtime() return."""
+	ts, end = _rescale_traces(traces, Verilog_VCD.timescale,
+		getattr(Verilog_VCD, 'endtime', None), units)
+	Verilog_VCD.timescale = ts
+	if end is not None:
+		Verilog_VCD.endtime = end
+
+def _rescale_traces(traces, ts, end, units):
+	"Rescale traces in place, return the new timescale and end time"
+	units = '1' + units.lower().replace(' ', '')
+	if ts is None or split_timescale(ts) is None or \
+		split_timescale(units) is None:
+		raise Verilog_VCD.VCDParseError("Error: Can't rescale from "\
+			"timescale '%s' to '%s'" % (ts, units))
+	for code, t in traces.items():
+		if isinstance(t, ClockTrace):
+			traces[code] = _rescale_clock(t, ts, units)
+		else:
+			t.time = rescale(t.time, ts, units)
+	if end is not None:
+		end = numpy.array([ end ], dtype = numpy.int64)
+		end = rescale(end, ts, units)[0].item()
+	return units, end
+
+def _rescale_clock(t, ts, units):
+	"Rescale a ClockTrace, it stays analytic unless times become fractional"
+	num, den = time_factor(ts, units)
+	if den != 1:
+		plain = t.expand()
+		plain.time = rescale(plain.time, ts, units)
+		return plain
+	for p in t.head, t.tail:
+		p.time = rescale(p.time, ts, units)
+	return ClockTrace(t.nets, t.phase * num, t.period * num, t.duty * num,
+		t.count, t.start, t.head, t.tail)
+
+def _file_time(t, ts, units):
+	"Latest time in timescale 'ts' that is not after time t in 'units'"
+	if t is None or not units:
+		return t
+	num, den = time_factor(ts, '1' + units.lower().replace(' ', ''))
+	return t * den // num
+
+def read_traces(file, siglist = [], opt_timescale = '', t0 = None, t1 = None):
+	"""Like load_vcd(), but returns (traces, timescale, endtime) and leaves
+the module state behind Verilog_VCD.get_timescale() and get_endtime()
+alone, so several files can be read at the same time in threads."""
+	if is_fst(file):
+		f = FSTFile(file)
+		ts = f.timescale
+	elif is_ghw(file):
+		f = GHWFile(file)
+		ts = f.timescale
+	else:
+		f = VCDFile(file, siglist)
+		ts = None
+		if opt_timescale and (t0 is not None or t1 is not None):
+			# The window is converted to the file units: read the header
+			h = VCDFile(file, siglist)
+			h.list_sigs()
+			ts = h.timescale
+
+	# The parsers only see the window, rounded to file units
+	w0 = _file_time(t0, ts, opt_timescale)
+	w1 = _file_time(t1, ts, opt_timescale)
+	if isinstance(f, VCDFile):
+		traces = _load_vcd(f, w1)
+		ts, end = f.timescale, f.endtime
+	else:
+		traces = from_vcd_dict(f.parse(siglist, w0, w1))
+		end = f.end_time
+
+	if opt_timescale:
+		ts, end = _rescale_traces(traces, ts, end, opt_timescale)
+
+	if t0 is not None or t1 is not None:
+		for code, t in traces.items():
+			traces[code] = t.window(t0, t1)
+		if t1 is not None and (end is None or end > t1):
+			end = t1
+	return traces, ts, end
+
+def load_vcd(file, siglist = [], opt_timescale = '', t0 = None, t1 = None):
+	"""Parse VCD file into columnar Traces.
+Returns a dict of Trace objects keyed by VCD identifier code, analogous
+to parse_vcd(). Signals without any value change get an empty Trace.
+FST files are read through fstreader, keyed by signal handle, GHDL GHW
+files through ghwreader, keyed by signal index range.
+Times are parsed as exact integers in the timescale of the file and
+rescaled to opt_timescale, if given, in one go per trace.
+If a time window t0..t1 is given (in the units of opt_timescale, or the
+file's own), parsing stops after t1 and every Trace starts with the
+value in effect at t0, see Trace.window()."""
+	traces, ts, end = read_traces(file, siglist, opt_timescale, t0, t1)
+	if ts is not None:
+		Verilog_VCD.timescale = ts
+	if end is not None:
+		Verilog_VCD.endtime = end
+	return traces
+
+def load_parallel(files, siglist = [], opt_timescale = '', workers = None):
+	"""Read several trace files side by side in a thread pool, for example
+the A/B traces of a co-simulation. Returns a list of (traces, timescale,
+endtime) tuples like read_traces(), in the order of 'files'."""
+	if workers is None:
+		workers = len(files)
+	with ThreadPoolExecutor(max_workers = max(workers, 1)) as pool:
+		return list(pool.map(
+			lambda f: read_traces(f, siglist, opt_timescale), files))
+
+def _load_vcd(vcd, until = None):
+	"Build Traces from the value changes of VCDFile 'vcd'"
+	sigs = vcd.data
+	builders = {}
+	# Plain files are scanned as bytes from a memory map, see BodyScanner
+	for t, code, v in vcd.iter_changes(use_mmap = 1, until = until):
+		b = builders.get(code)
+		if b is None:
+			b = builders[code] = _Builder(sigs[code]['nets'])
+		b.add(t, v)
+
+	traces = {}
+	for code, s in sigs.items():
+		if code in builders:
+			traces[code] = builders[code].finish()
+		else:
+			traces[code] = _Builder(s['nets']).finish()
+
+	return traces
+
+def from_vcd_dict(data):
+	"Convert a parse_vcd() result into a dict of Traces"
+	return dict((code, Trace.from_tv(s['nets'], s.get('tv', []))) \
+		for code, s in data.items())
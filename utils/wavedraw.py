@@ -1,18 +1,134 @@
 # Auxiliaries to display a waveform
 
+import math
 import sys
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing.shared_memory import SharedMemory
 
-from  Verilog_VCD import parse_vcd
+import numpy
 
-def to_wave(desc, trigger, delta, context = None):
+from Verilog_VCD import VCDFile, _wildcard
+from fstreader import is_fst
+from ghwreader import is_ghw
+from vcdtrace import Trace, ClockTrace, load_vcd, read_traces, decode_bits, \
+	format_hex, KIND_BITS, KIND_WIDE
+from vcdcache import load_vcd_cached, read_cached
+
+# Hex digit pairs of all byte values
+_BYTE_HEX = numpy.frombuffer(''.join('%02x' % b for b in range(256))
+	.encode('ascii'), dtype = numpy.uint8).reshape(256, 2)
+
+# Wave characters of single bits, indexed by value + 2 * unknown
+_BIT_CHARS = numpy.frombuffer(b'01xz', dtype = numpy.uint8)
+
+def _time_column(wform):
+	"Return the event times of a Trace or (time, value) list as array"
+	if isinstance(wform, ClockTrace):
+		return wform.edge_times()
+	if isinstance(wform, Trace):
+		return wform.time
+	return numpy.array([ t for t, _ in wform ])
+
+def sample_points(time, trig, delta):
+	"""Return the indices into the trigger event times 'trig' at which the
+events at 'time' are shown: every event at the first trigger event not
+before its own time minus 'delta', and after the one of the previous
+event. Events left over at the end of the trigger are dropped.
+This is the event matching of to_wave(), done in one searchsorted() call."""
+	k = numpy.arange(len(time))
+	s = numpy.searchsorted(trig, time - delta, 'left')
+	# k[j] = max(s[j], k[j-1] + 1)
+	k += numpy.maximum.accumulate(s - k)
+	return k[k < len(trig)]
+
+def sample_values(wform, trig, delta):
+	"""Sample the events of wform (a Trace or (time, value) list) at the
+trigger event times 'trig' (plus 'delta'). Returns the trigger indices k
+and the event indices j of the latest event at each of them, where it
+differs from the one before."""
+	if isinstance(wform, Trace):
+		j = wform.indices(trig + delta) - 1
+	else:
+		j = numpy.searchsorted(_time_column(wform), trig + delta, 'right') - 1
+	new = j >= 0
+	new[1:] &= j[1:] != j[:-1]
+	return numpy.flatnonzero(new), j[new]
+
+# Level a trigger changes to in the edge modes
+EDGES = { 'posedge' : '1', 'negedge' : '0', 'both' : None }
+
+def trigger_slots(trigger, edge = 'both'):
+	"""Return the times of the trigger events that make up the wave columns:
+rising ('posedge'), falling ('negedge') or all ('both') changes"""
+	if edge not in EDGES:
+		raise ValueError("Unknown edge mode '%s'" % edge)
+	level = EDGES[edge]
+	if isinstance(trigger, ClockTrace):
+		# From phase, period and duty, without expanding the clock
+		return trigger.edge_times(None if level is None else int(level))
+	time = _time_column(trigger)
+	if level is None:
+		return time
+	if getattr(trigger, 'kind', None) == KIND_BITS:
+		hit = trigger.value == int(level)
+		if trigger.unknown is not None:
+			hit &= trigger.unknown == 0
+	else:
+		hit = numpy.array([ v == level for _, v in trigger ], dtype = bool)
+	return time[hit]
+
+def _ones(size, words):
+	"All ones value of 'size' bits, as uint64 words"
+	m = (1 << size) - 1
+	return numpy.frombuffer(m.to_bytes(8 * words, 'little'),
+		dtype = numpy.uint64)
+
+def hex_labels(v, u, size):
+	"""Return the data labels of distinct 'size' bit values: an array of
+ASCII codes, one row per value holding its format_hex() digits and a
+space, and a mask of the values that are all x or z (these get no label).
+v and u are the value and unknown planes, 1-D up to 64 bits, otherwise
+rows of uint64 words."""
+	digits = (size + 3) // 4
+	chars = numpy.full((len(v), digits + 1), ord(' '), dtype = numpy.uint8)
+	if v.ndim == 1:
+		v = v.astype('<u8')
+		u = u.astype(numpy.uint64)
+		unknown = u == _ones(size, 1)[0]
+		# Bytes, most significant first
+		nb = (digits + 1) // 2
+		b = v.view(numpy.uint8).reshape(len(v), 8)[:, nb - 1::-1]
+		chars[:, :digits] = _BYTE_HEX[b].reshape(len(v), 2 * nb)[:, nb * 2 - digits:]
+		partial = numpy.flatnonzero((u != 0) & ~unknown)
+		for i in partial.tolist():
+			chars[i, :digits] = numpy.frombuffer(format_hex(int(v[i]), int(u[i]),
+				size).encode('ascii'), dtype = numpy.uint8)
+	else:
+		unknown = (u == _ones(size, u.shape[1])).all(axis = 1)
+		for i in range(len(v)):
+			s = format_hex(int.from_bytes(v[i].tobytes(), 'little'),
+				int.from_bytes(u[i].tobytes(), 'little'), size)
+			chars[i, :digits] = numpy.frombuffer(s.encode('ascii'),
+				dtype = numpy.uint8)
+	return chars, unknown
+
+def to_wave(desc, trigger, delta, context = None, edge = 'both'):
+	trig = trigger_slots(trigger[1], edge)
+	return _to_wave(desc, trig, delta, edge, desc[1] == trigger[1])
+
+def _to_wave(desc, trig, delta, edge, own, window = None):
+	"""to_wave() on the trigger event times 'trig'. 'own' is set for the
+row of the trigger signal itself. 'window' is (cut, t0) if the traces were
+cut at 'cut' for a view starting at t0: samples up to 'cut' are the values
+carried in, and trigger events before t0 are no columns."""
 	def from_bitvec(x, wtype = None, context = None):
-		if x[0] == 'x':
-			return ('x', "")
-		else:
-			try:
-				return ('=', "%02x " % (int(x, 2)))
-			except ValueError:
-				return ('x', "")
+		if x not in labels:
+			v, u = decode_bits(x, l)
+			if u == (1 << l) - 1:
+				labels[x] = ('x', "")
+			else:
+				labels[x] = ('=', format_hex(v, u, l) + ' ')
+		return labels[x]
 
 	def from_string(x, wtype, context = None):
 		if wtype == 'string':
@@ -37,24 +153,13 @@ def to_wave(desc, trigger, delta, context = None):
 		
 	def from_bit(x, wtype = None, context = None):
 		return (x, x)
-	
-	def to_none_bit(x):
-		return '.', None
-	
-	def to_none_data(x):
-		if x == None:
-			return '.', None
-		else: 
-			return '.', None
-		
-	
 
 	l, wform, wtype, spec = desc
 
-	a = ''
-
 	# Create a simple color context, starting with code '3'
 	context = [3, {} ]
+	# Bus labels by value string
+	labels = {}
 
 	# If we have a delta config, override default delta
 	if spec and 'delta' in spec:
@@ -62,88 +167,323 @@ def to_wave(desc, trigger, delta, context = None):
 
 	if wtype == 'string':
 		from_val = from_string
-		to_none = to_none_data
 		b = []
 	else:
 		b = ''
 
 		if l > 1:
 			from_val = from_bitvec
-			to_none = to_none_data
 		else:
 			from_val = from_bit
-			to_none = to_none_bit
 
-	trigger = trigger[1]
+	# The columns shown, and the trigger events before them
+	first = 0 if window is None else int(numpy.searchsorted(trig, window[1]))
+	shown = trig[first:]
 
-	if wform == trigger:
-		for i in trigger:
-			val = from_val(i[1])
-			a += val[0]
-			b += val[1]
-		return a, b
-	
-	cur = trigger[0][0]
-	next_evt = wform[0][0] # First event
-	j = 0
-	n = len(wform)
-	lastval = wform[0][1]
-
-	last = trigger[-1][0] + 100
-	for i in trigger:
-		cur = i[0]
-		if cur >= next_evt - delta:
-			val = from_val(wform[j][1], wtype, context)
-			a += val[0]
-			if val[1]:
-				b += val[1]
-				lastval = val[1]
-			j += 1
-			if j == n:
-				next_evt = last			   
+	# Trigger index k at which event j of wform appears. All changes are
+	# shown when sampling on both edges, otherwise the values at each edge
+	if own:
+		if edge != 'both':
+			# One clock period per column
+			return ('p' if edge == 'posedge' else 'n').ljust(len(shown), '.') \
+				if len(shown) else '', ''
+		k = numpy.arange(len(shown))
+		j = numpy.searchsorted(_time_column(wform), shown, 'right') - 1
+	elif edge == 'both':
+		time = _time_column(wform)
+		# Up to delta after the cut, the trigger events a change is due to
+		# may be missing: such changes are before the window anyway
+		c = 0 if window is None else int(numpy.searchsorted(time,
+			window[0] + delta, 'right'))
+		k = sample_points(time[c:], trig, delta) - first
+		j = numpy.arange(c, c + len(k))
+		if window is not None:
+			# The value carried in and the changes falling into columns
+			# before the window only make up the state at its first column,
+			# shown there unless a change is
+			pre = int((k < 0).sum())
+			state = c + pre - 1
+			k, j = k[pre:], j[pre:]
+			if state >= 0 and len(shown) and (not len(k) or k[0] > 0):
+				k = numpy.concatenate(([ 0 ], k))
+				j = numpy.concatenate(([ state ], j))
+	else:
+		k, j = sample_values(wform, shown, delta)
+	trig = shown
+	n = len(k)
+
+	# Bit Traces are sampled on their bit planes, without value strings
+	if wtype != 'string' and \
+		getattr(wform, 'kind', None) in (KIND_BITS, KIND_WIDE):
+		wave = numpy.full(len(trig), ord('.'), dtype = numpy.uint8)
+		v, u = wform.planes(j)
+		if l > 1:
+			if u is None:
+				u = numpy.zeros_like(v)
+			# Only changes of the value are shown, every distinct value is
+			# formatted once
+			if v.ndim == 1 and not u.any():
+				# Plain values are formatted faster than looked up
+				new = numpy.ones(n, dtype = bool)
+				new[1:] = v[1:] != v[:-1]
+				chars, unknown = hex_labels(v[new], u[new], l)
+				inv = numpy.arange(len(chars))
 			else:
-				next_evt = wform[j][0]
+				rows = numpy.hstack((v, u)) if v.ndim > 1 \
+					else numpy.stack((v, u), 1)
+				new = numpy.ones(n, dtype = bool)
+				new[1:] = (rows[1:] != rows[:-1]).any(axis = 1)
+				rows, inv = numpy.unique(rows[new], axis = 0,
+					return_inverse = True)
+				half = rows.shape[1] // 2
+				vals, unk = rows[:, :half], rows[:, half:]
+				if v.ndim == 1:
+					vals, unk = vals[:, 0], unk[:, 0]
+				chars, unknown = hex_labels(vals, unk, l)
+			inv = inv.ravel()
+			x = unknown[inv]
+			wave[k[new]] = numpy.where(x, ord('x'), ord('='))
+			b = chars[inv[~x]].tobytes().decode('ascii')
 		else:
-			v = to_none(lastval)
-			a += v[0]
-			if v[1]:
-				b += v[1]
+			c = v.astype(numpy.intp)
+			if u is not None:
+				c += 2 * (u != 0)
+			c = _BIT_CHARS[c]
+			wave[k] = c
+			b = c.tobytes().decode('ascii')
+		return wave.tobytes().decode('ascii'), b
+
+	a = [ '.' ] * len(trig)
+	prev = None
+	for i, e in zip(k.tolist(), j.tolist()):
+		x = wform[e][1]
+		if from_val == from_bitvec:
+			# Repeated bus values continue the previous one
+			if x == prev:
+				continue
+			prev = x
+		val = from_val(x, wtype, context)
+		a[i] = val[0]
+		if val[1]:
+			b += val[1]
+
+	return ''.join(a), b
+
+
+def _trigger_times(vcdfile, trigname, edge, cache = False):
+	"""Yield the event times of the trigger signal, reading only as needed,
+or the complete trigger through the trace cache"""
+	if cache or is_fst(vcdfile) or is_ghw(vcdfile):
+		read = read_cached if cache else read_traces
+		traces, _, _ = read(vcdfile, [ trigname ])
+		for t in traces.values():
+			yield from trigger_slots(t, edge).tolist()
+	else:
+		level = EDGES[edge]
+		for t, _, v in VCDFile(vcdfile, [ trigname ]).iter_changes():
+			if level is None or v == level:
+				yield t
+
+def _cycle_window(vcdfile, trigname, start, end, max_cycles, cycles, edge,
+	cache = False):
+	"""Return the time window (t0, t1) covering the selected trigger events.
+With 'cycles', start and end are event indices, otherwise times."""
+	t0 = t1 = None
+	first = None
+	for i, t in enumerate(_trigger_times(vcdfile, trigname, edge, cache)):
+		if first is None:
+			if start is not None and (i if cycles else t) < start:
+				continue
+			first = i
+			t0 = t
+		if end is not None and ((i >= end) if cycles else (t > end)):
+			break
+		if max_cycles is not None and i - first >= max_cycles:
+			break
+		t1 = t
+
+	if t1 is None:
+		raise ValueError("No trigger events in the selected range")
+	return t0, t1
+
+def _cfg_lookup(cfg):
+	"""Return a function mapping a signal name to its cfg entry. Keys are
+full signal names or wildcard patterns ('*', '?'), exact names take
+precedence. Raises KeyError for signals not in cfg."""
+	patterns = [ (_wildcard(k).match, spec) for k, spec in cfg.items() \
+		if '*' in k or '?' in k ]
+
+	def lookup(name):
+		if name in cfg:
+			return cfg[name]
+		for match, spec in patterns:
+			if match(name):
+				return spec
+		raise KeyError(name)
+
+	return lookup
+
+def _spacing(t):
+	"Mean time between the wave columns at times t, None if unknown"
+	if len(t) < 2:
+		return None
+	return float(t[-1] - t[0]) / (len(t) - 1)
 
-	# print(a, "--", b)
-	return a, b
+# Trigger event times in the worker processes of vcd2wave(), by (trigger,
+# edge), mapped from the shared memory block of the parent
+_shared = {}
 
+def _attach(name, layout):
+	"Pool initializer: map the trigger event times"
+	shm = _shared['shm'] = SharedMemory(name)
+	for key, (dtype, offset, n) in layout.items():
+		_shared[key] = numpy.ndarray(n, dtype = dtype, buffer = shm.buf,
+			offset = offset)
+
+def _convert_one(desc, trig, delta, edge, own, window):
+	try:
+		return _to_wave(desc, trig, delta, edge, own, window)
+	except AssertionError:
+		return None
+
+def _convert(job):
+	"Run to_wave() in a worker, None on failure"
+	desc, key, delta, own, window = job
+	try:
+		return _to_wave(desc, _shared[key], delta, key[1], own, window)
+	except AssertionError:
+		return None
+
+def _convert_parallel(jobs, slots, triggers, delta, window, workers):
+	"""Convert the (name, desc, (trigger, edge)) jobs in a process pool.
+The trigger event times 'slots' by (trigger, edge) are passed once through
+shared memory, only the signals themselves are sent with the jobs.
+Returns the results in order."""
+	layout = {}
+	size = 0
+	for key, t in slots.items():
+		layout[key] = (t.dtype.str, size, len(t))
+		size += (t.nbytes + 7) & ~7
+
+	shm = SharedMemory(create = True, size = max(size, 1))
+	try:
+		for key, t in slots.items():
+			dtype, offset, n = layout[key]
+			a = numpy.ndarray(n, dtype = dtype, buffer = shm.buf, offset = offset)
+			a[:] = t
+			del a
 
-def vcd2wave(vcdfile, trigname, cfg = None, delta = 4):
+		args = [ (desc, key, delta, desc[1] == triggers[key[0]][1], window) \
+			for _, desc, key in jobs ]
+		with ProcessPoolExecutor(max_workers = workers, initializer = _attach,
+			initargs = (shm.name, layout)) as pool:
+			chunk = max(1, len(jobs) // (workers * 4))
+			return list(pool.map(_convert, args, chunksize = chunk))
+	finally:
+		shm.close()
+		shm.unlink()
+
+def vcd2wave(vcdfile, trigname, cfg = None, delta = 4, cache = False,
+	start = None, end = None, max_cycles = None, cycles = False,
+	edge = 'both', workers = None):
 	"""Simple conversion of VCD file.
 Requires passing of the name of the trigger signal, normally the highest
 running clock in the system. The signals are sampled according to that
-clock and returned as schematic waveform for wavedrom display"""
-	vcd = parse_vcd(vcdfile)
+clock and returned as schematic waveform for wavedrom display.
+With 'cache' set, the parsed trace is kept in the trace cache (see
+vcdcache), so re-running a cell on an unchanged VCD is quick.
+If 'cfg' is given, only its signals and the trigger are parsed. Its keys
+may be wildcard patterns like 'tb.dut.*'.
+The displayed range can be limited to the times 'start' to 'end'
+(inclusive, in the timescale of the trace) or, with 'cycles' set, to
+the trigger events (wave columns) 'start' up to, not including, 'end'.
+'max_cycles' limits the number of trigger events shown. Only the trace up
+to the end of the range is parsed, signals start with the value they have
+at the start of the range.
+'edge' selects the trigger changes that make up the columns: 'posedge',
+'negedge' or 'both' (default). With a single edge, the signals are shown
+with their value at each edge. A cfg entry can set its own 'trigger' and
+'edge', so that every clock domain of a design is sampled on its own
+clock; such rows get a wavedrom 'period' relative to the main trigger.
+Bus values are labelled in hex of the bus width, only where they change;
+partly unknown values show their unknown nibbles, see format_hex().
+With 'workers' > 1, the signals are converted in a pool of that many
+processes, in the same order."""
+	if edge not in EDGES:
+		raise ValueError("Unknown edge mode '%s'" % edge)
+
+	if cycles or max_cycles is not None:
+		t0, t1 = _cycle_window(vcdfile, trigname, start, end, max_cycles,
+			cycles, edge, cache)
+	else:
+		t0, t1 = start, end
+
+	# Signal changes up to 'delta' after the last trigger event still show
+	deltas = [ spec['delta'] for spec in (cfg or {}).values() \
+		if spec and 'delta' in spec ]
+	most = max([ delta ] + deltas)
+	until = t1
+	if t1 is not None:
+		until = t1 + most
+
+	# The main trigger and the ones of cfg entries
+	trignames = [ trigname ]
+	siglist = []
+	if cfg != None:
+		for spec in cfg.values():
+			if spec and 'trigger' in spec and spec['trigger'] not in trignames:
+				trignames.append(spec['trigger'])
+		siglist = list(cfg) + trignames
+
+	# The traces are cut well before t0: the values carried in and the
+	# changes up to t0 only seed the state of the signals, and the trigger
+	# events before t0 are no wave columns, but take the changes within
+	# delta before them, as in the complete trace
+	window = None
+	cut = None
+	if t0 is not None:
+		cut = math.ceil(t0 - 2 * most) - 1
+		window = (cut, t0)
+	if cache:
+		vcd = load_vcd_cached(vcdfile, siglist, t0 = cut, t1 = until)
+	else:
+		vcd = load_vcd(vcdfile, siglist, t0 = cut, t1 = until)
+
+	triggers = {}
+	for nm, t in vcd.items():
+		net = t.nets[0]
+		name = net['hier'] + '.' + net['name']
+		if name in trignames:
+			if t1 is not None:
+				t = vcd[nm] = t.window(None, t1)
+			triggers[name] = (int(net['size']), t, net['type'], None)
 
 	vcd_dict = {}
 	if cfg == None:
 		for nm, t in vcd.items():
-			trace = t['nets'][0]
+			trace = t.nets[0]
 			identifier = trace['hier'] + '.' + trace['name']
 			s = int(trace['size'])
 			tp = trace['type']
-			if 'tv' in t:
-				vcd_dict[identifier] = (s, t['tv'], tp, None)
+			if len(t):
+				vcd_dict[identifier] = (s, t, tp, None)
 			else:
 				print("Warning: no timevalue for %s" % identifier)
 				vcd_dict[identifier] = (s, [(0, 'x')], tp, None)
 				print(t)
 	else:
+		lookup = _cfg_lookup(cfg)
 		for nm, t in vcd.items():
-			trace = t['nets'][0]
+			trace = t.nets[0]
 			identifier = trace['hier'] + '.' + trace['name']
 			s = int(trace['size'])
 			tp = trace['type']
-			if 'tv' in t:
-				if identifier in cfg:
-					vcd_dict[identifier] = (s, t['tv'], tp, cfg[identifier])
-				elif identifier == trigname:
-					vcd_dict[trigname] = (s, t['tv'], tp, None)
+			if len(t):
+				try:
+					vcd_dict[identifier] = (s, t, tp, lookup(identifier))
+				except KeyError:
+					if identifier == trigname:
+						vcd_dict[trigname] = (s, t, tp, None)
 			else:
 				print("Warning: no timevalue for %s" % identifier)
 
@@ -156,19 +496,49 @@ clock and returned as schematic waveform for wavedrom display"""
 		for n, _ in vcd_dict.items():
 			print(n)
 		raise ValueError("Signal not found")
-	
+	triggers[trigname] = trigger
+
+	jobs = []
 	for n, wave in vcd_dict.items():
+		spec = wave[3] or {}
+		sig_trigger = spec.get('trigger', trigname)
+		sig_edge = spec.get('edge', edge)
+		if sig_trigger not in triggers:
+			raise ValueError("Trigger signal '%s' not found" % sig_trigger)
+		jobs.append( (n, wave, (sig_trigger, sig_edge)) )
+
+	# Wave column times and spacing per (trigger, edge), computed once
+	slots = {}
+	for key in [ (trigname, edge) ] + [ key for _, _, key in jobs ]:
+		if key not in slots:
+			trig = trigger_slots(triggers[key[0]][1], key[1])
+			slots[key] = trig if cut is None else trig[trig > cut]
+	spacing = dict((key, _spacing(t)) for key, t in slots.items())
 
-		try:
-			wdwaveform, data = to_wave(wave, trigger, delta)
-		except AssertionError:
+	if workers is not None and workers > 1 and len(jobs) > 1:
+		results = _convert_parallel(jobs, slots, triggers, delta, window,
+			workers)
+	else:
+		results = (_convert_one(wave, slots[key], delta, key[1],
+			wave[1] == triggers[key[0]][1], window) for _, wave, key in jobs)
+
+	for (n, wave, key), result in zip(jobs, results):
+		if result is None:
 			print("Failed to create waveform for '%s'" % n)
+			continue
+		wdwaveform, data = result
 
 		if data != "":
 			trace = { 'name' : n, 'wave' : wdwaveform, 'data' : data}
 		else:
 			trace = { 'name' : n, 'wave' : wdwaveform}
 
+		base = spacing[(trigname, edge)]
+		if key != (trigname, edge) and base and spacing[key]:
+			period = round(spacing[key] / base, 3)
+			if period != 1:
+				trace['period'] = period
+
 		signals.append(trace)
 		
 	wdrom = { 'signal' : signals}	 
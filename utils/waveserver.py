@@ -0,0 +1,331 @@
+# Local HTTP server of waveform tiles
+#
+# Usage:
+#
+#   python waveserver.py trace.vcd [port]
+#
+# or from a notebook, where the server runs in a background thread:
+#
+#   srv = waveserver.start('trace.vcd')
+#   srv.iframe()
+#
+# Instead of embedding the complete waveform JSON in the notebook, a
+# browser fetches tiles of a signal set, time window and zoom level as
+# they are panned into view:
+#
+#   /                    Minimal front-end, drag to pan, wheel to zoom
+#   /signals?pattern=    JSON list of signal names (wildcards allowed)
+#   /tile.svg?sig=...    SVG rendering of the tile (see wavesvg)
+#   /tile.json?sig=...   Segments of the tile as JSON
+#
+# Tiles are given by 't0' and 't1', or by 'zoom' and 'tile': with zoom z
+# one pixel is 2^z time units, and tile i starts at i * width * 2^z.
+# 'width' is the tile width in pixels. Coarse tiles are drawn from the
+# pyramids of vcdpyramid, which are kept in memory with the signal index.
+# Fine ones are read from the file for the signals and time window of the
+# tile only, through the checkpoints of vcdindex for VCD files.
+#
+# The server only listens on localhost by default. In the docker
+# container, pass host '0.0.0.0' and publish the port as well, for
+# example with '-p 8889:8889'.
+#
+
+import asyncio
+import io
+import json
+import math
+import os
+import sys
+import threading
+from urllib.parse import urlsplit, parse_qs
+from xml.sax.saxutils import escape, quoteattr
+
+from vcdtrace import KIND_BITS, read_traces, from_vcd_dict
+from fstreader import is_fst
+from ghwreader import is_ghw
+from vcdindex import VCDIndex
+from vcdpyramid import load_pyramids
+from vcdscope import load_index
+import wavesvg
+
+PORT = 8889
+
+# Largest tile width in pixels
+MAX_WIDTH = 4000
+
+_INDEX = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>%(file)s</title></head>
+<body style="margin: 0">
+<div style="font: 12px monospace; padding: 4px">
+<input id="sigs" size="80" value=%(sigs)s>
+<button onclick="view.go()">Show</button> %(file)s
+</div>
+<div id="wave" style="overflow: hidden; cursor: move"><img id="img"></div>
+<script>
+var view = {
+	t0: 0, dt: 1, width: %(width)d,
+	go: function() {
+		var q = document.getElementById('sigs').value.split(/[ ,]+/)
+			.filter(function(s) { return s; })
+			.map(function(s) { return 'sig=' + encodeURIComponent(s); });
+		q.push('t0=' + Math.round(this.t0), 't1=' + Math.round(this.t0 +
+			this.dt * this.width), 'width=' + this.width);
+		document.getElementById('img').src = 'tile.svg?' + q.join('&');
+	}
+};
+var wave = document.getElementById('wave'), drag = null;
+wave.onmousedown = function(e) { drag = e.clientX; e.preventDefault(); };
+window.onmouseup = function(e) {
+	if (drag !== null) {
+		view.t0 = Math.max(0, view.t0 - (e.clientX - drag) * view.dt);
+		drag = null;
+		view.go();
+	}
+};
+wave.onwheel = function(e) {
+	var x = e.clientX - %(names)d, f = e.deltaY > 0 ? 2 : 0.5;
+	var t = view.t0 + x * view.dt;
+	view.dt = Math.max(view.dt * f, 1 / 64);
+	view.t0 = Math.max(0, t - x * view.dt);
+	e.preventDefault();
+	view.go();
+};
+fetch('tile.json?width=1&' + document.getElementById('sigs').value
+	.split(/[ ,]+/).filter(function(s) { return s; })
+	.map(function(s) { return 'sig=' + encodeURIComponent(s); }).join('&'))
+	.then(function(r) { return r.json(); })
+	.then(function(j) { view.dt = Math.max(j.t1 / view.width, 1); view.go(); });
+</script>
+</body></html>
+"""
+
+class HTTPError(Exception):
+	def __init__(self, status, msg):
+		Exception.__init__(self, msg)
+		self.status = status
+
+_REASONS = { 200 : 'OK', 400 : 'Bad Request', 404 : 'Not Found',
+	405 : 'Method Not Allowed', 500 : 'Internal Server Error' }
+
+def _arg(q, name, conv, default = None):
+	if name not in q:
+		return default
+	try:
+		return conv(q[name][0])
+	except ValueError:
+		raise HTTPError(400, "Bad value of '%s'" % name)
+
+def _label(trace, i):
+	if trace.kind == KIND_BITS and trace.size == 1:
+		return trace.value_str(i)
+	return wavesvg._label(trace, i)
+
+class WaveServer:
+	"""Serves tiles of one trace file. Pyramids and the signal index are
+loaded once, on first use, fine tiles are read from the file."""
+
+	def __init__(self, file, host = '127.0.0.1', port = PORT, width = 1000):
+		self.file = file
+		self.host = host
+		self.port = port
+		self.width = width
+		self.server = None
+		self._loop = None
+		self._pyramids = None
+		self._index = None
+		self._checkpoints = None
+		self._lock = threading.Lock()
+		self._started = threading.Event()
+
+	def pyramids(self):
+		with self._lock:
+			if self._pyramids is None:
+				self._pyramids = load_pyramids(self.file)
+			return self._pyramids
+
+	def sigindex(self):
+		with self._lock:
+			if self._index is None:
+				self._index = load_index(self.file)
+			return self._index
+
+	def checkpoints(self):
+		"The VCDIndex of a VCD file, built with its sidecar on first use"
+		with self._lock:
+			if self._checkpoints is None:
+				self._checkpoints = VCDIndex(self.file)
+			return self._checkpoints
+
+	def _read(self, codes, t0, t1):
+		"Read the time window t0..t1 of the signals 'codes' only"
+		sigs = self.sigindex().sigs
+		names = [ net['hier'] + '.' + net['name'] \
+			for net in (sigs[code]['nets'][0] for code in codes) ]
+		if not names:
+			return {}
+		# The window starts with a sample at t0, times are integers
+		t0 = 0 if t0 is None else math.floor(t0)
+		if is_fst(self.file) or is_ghw(self.file):
+			return read_traces(self.file, names, t0 = t0, t1 = t1)[0]
+		return from_vcd_dict(self.checkpoints().read_window(t0, t1, names))
+
+	def tile(self, q):
+		"""Return (traces, pyramids, t0, t1, width) of the tile requested by
+the query dict q"""
+		width = _arg(q, 'width', int, self.width)
+		if not 0 < width <= MAX_WIDTH:
+			raise HTTPError(400, "Tile width out of range")
+		# All signals if none given, like vcd2svg()
+		sigs = q.get('sig', [])
+		index = self.sigindex()
+		names = [ n for s in sigs for n in index.glob(s) ]
+		if sigs and not names:
+			raise HTTPError(404, "No such signals")
+
+		if 'zoom' in q:
+			dt = 2.0 ** _arg(q, 'zoom', int)
+			t0 = _arg(q, 'tile', int, 0) * width * dt
+			t1 = t0 + width * dt
+		else:
+			t0 = _arg(q, 't0', float)
+			t1 = _arg(q, 't1', float)
+
+		pyramids = self.pyramids()
+		codes = set(index.codes(names)) if names else pyramids
+		codes = [ code for code in pyramids if code in codes ]
+		traces, pyramids, t0, t1 = wavesvg.pyramid_view(codes, pyramids,
+			self._read, t0, t1, width)
+		return traces, pyramids, t0, t1, width
+
+	def tile_svg(self, q):
+		traces, pyramids, t0, t1, width = self.tile(q)
+		buf = io.StringIO()
+		wavesvg.render(traces, buf, t0, t1, width, pyramids)
+		return 'image/svg+xml', buf.getvalue()
+
+	def tile_json(self, q):
+		"""Segments of a tile: per signal a list of [x0, x1, label], with the
+label None for busy segments"""
+		traces, pyramids, t0, t1, width = self.tile(q)
+		sigs = []
+		for w, segs, _ in wavesvg.rows(traces, t0, t1, width, pyramids):
+			sigs.append({ 'name' : w.name, 'size' : w.size,
+				'segments' : [ [ x0, x1, None if i == wavesvg.BUSY else
+					_label(w, i) ] for x0, x1, i in segs ] })
+		tile = { 't0' : t0, 't1' : t1, 'width' : width, 'signals' : sigs }
+		return 'application/json', json.dumps(tile)
+
+	def signals(self, q):
+		index = self.sigindex()
+		pattern = _arg(q, 'pattern', str)
+		names = index.glob(pattern) if pattern else index.list_sigs()
+		return 'application/json', json.dumps(names)
+
+	def index(self, q):
+		names = self.sigindex().list_sigs()
+		page = _INDEX % { 'file' : escape(os.path.basename(self.file)),
+			'sigs' : quoteattr(' '.join(names[:8])), 'width' : self.width,
+			'names' : wavesvg.NAME_WIDTH }
+		return 'text/html; charset=utf-8', page
+
+	def handle(self, path, q):
+		"Return (content type, body) for a GET request"
+		routes = { '/' : self.index, '/signals' : self.signals,
+			'/tile.svg' : self.tile_svg, '/tile.json' : self.tile_json }
+		if path not in routes:
+			raise HTTPError(404, "Not found: %s" % path)
+		return routes[path](q)
+
+	async def _client(self, reader, writer):
+		try:
+			line = await reader.readline()
+			# Skip the headers
+			while (await reader.readline()).strip():
+				pass
+			try:
+				method, target, _ = line.decode('latin-1').split()
+				if method != 'GET':
+					raise HTTPError(405, "Only GET is supported")
+				url = urlsplit(target)
+				# Parsing and rendering run in the default executor
+				ctype, body = await asyncio.get_running_loop().run_in_executor(
+					None, self.handle, url.path, parse_qs(url.query))
+				status = 200
+			except HTTPError as e:
+				status, ctype, body = e.status, 'text/plain', str(e)
+			except ValueError:
+				status, ctype, body = 400, 'text/plain', "Bad request"
+			except Exception as e:
+				status, ctype, body = 500, 'text/plain', repr(e)
+
+			data = body.encode('utf-8')
+			writer.write(('HTTP/1.1 %d %s\r\n'
+				'Content-Type: %s\r\n'
+				'Content-Length: %d\r\n'
+				'Access-Control-Allow-Origin: *\r\n'
+				'Connection: close\r\n\r\n'
+				% (status, _REASONS[status], ctype, len(data))).encode('latin-1'))
+			writer.write(data)
+			await writer.drain()
+		except ConnectionError:
+			pass
+		finally:
+			writer.close()
+
+	async def serve(self):
+		"Run the server in the current event loop until cancelled"
+		self.server = await asyncio.start_server(self._client, self.host,
+			self.port)
+		self.port = self.server.sockets[0].getsockname()[1]
+		self._started.set()
+		async with self.server:
+			await self.server.serve_forever()
+
+	def url(self, path = '/'):
+		return 'http://%s:%d%s' % (self.host, self.port, path)
+
+	def stop(self):
+		if self._loop is not None:
+			self._loop.call_soon_threadsafe(self.server.close)
+
+	def iframe(self, width = '100%', height = 400):
+		"Display the front-end in a notebook"
+		from IPython.display import IFrame
+		return IFrame(self.url(), width, height)
+
+def start(file, host = '127.0.0.1', port = PORT, width = 1000):
+	"""Start a WaveServer for a trace file in a background thread, for use
+from a notebook whose own event loop is already running. Port 0 picks a
+free port."""
+	srv = WaveServer(file, host, port, width)
+	error = []
+
+	def run():
+		srv._loop = asyncio.new_event_loop()
+		try:
+			srv._loop.run_until_complete(srv.serve())
+		except asyncio.CancelledError:
+			pass
+		except OSError as e:
+			# For example the port in use
+			error.append(e)
+		finally:
+			srv._started.set()
+
+	threading.Thread(target = run, daemon = True).start()
+	srv._started.wait()
+	if error:
+		raise error[0]
+	return srv
+
+if __name__ == '__main__':
+	if len(sys.argv) < 2:
+		print("Usage: %s trace.vcd [port]" % sys.argv[0])
+		sys.exit(1)
+	port = int(sys.argv[2]) if len(sys.argv) > 2 else PORT
+	srv = WaveServer(sys.argv[1], port = port)
+	print("Serving %s on %s" % (sys.argv[1], srv.url()))
+	try:
+		asyncio.run(srv.serve())
+	except KeyboardInterrupt:
+		pass
@@ -0,0 +1,343 @@
+# Server side SVG rendering of waveforms
+#
+# Usage:
+#
+#   python wavesvg.py trace.vcd out.svg [signal or pattern ...]
+#
+# vcd2wave() output is drawn by wavedrom in the browser, which does not
+# scale beyond a few thousand cycles. This renderer draws Traces straight
+# to SVG, one row per signal, streamed to a file or returned as string.
+#
+# The cost depends on the pixel width rather than the number of changes:
+# changes falling into the same pixel column are collapsed into grey
+# "busy" blocks, and fast ClockTraces are drawn as one busy block without
+# expanding their edges. With the pyramids of vcdpyramid, zoomed out
+# rows are drawn from the matching level alone: columns from its change
+# counts, labels from its values and busy blocks shaded by the range of
+# values in each column, without reading the changes of the trace.
+#
+
+import io
+import sys
+from xml.sax.saxutils import escape
+
+import numpy
+
+from vcdtrace import ClockTrace, load_vcd, KIND_BITS, KIND_WIDE
+from vcdcache import load_vcd_cached, read_cached
+from vcdpyramid import load_pyramids
+from vcdscope import load_index
+
+# Layout in pixels
+NAME_WIDTH = 200
+ROW_HEIGHT = 24
+WAVE_HEIGHT = 16
+CHAR_WIDTH = 7
+
+# Minimum pixels per clock period to draw the edges of a ClockTrace
+CLOCK_MIN_PERIOD = 4
+
+# Marker of busy segments, in place of a sample index
+BUSY = -1
+
+_STYLE = """<style>
+text { font: 12px monospace; fill: #000; }
+.w { fill: none; stroke: #080; stroke-width: 1; }
+.v { fill: none; stroke: #000; stroke-width: 1; }
+.x { fill: #f88; stroke: #c00; stroke-width: 1; }
+.z { fill: none; stroke: #00c; stroke-width: 1; }
+.b { fill: #aaa; stroke: none; }
+.e { fill: #666; stroke: none; }
+</style>
+"""
+
+def segments(time, t0, scale, width):
+	"""Reduce the sample times of a trace to at most one segment per pixel
+column. Returns a list of (x0, x1, i): pixel range and index of the
+sample shown there, or BUSY where a column holds more than one change.
+Consecutive busy columns are merged."""
+	if not len(time):
+		return []
+	x = numpy.floor((time - t0) * scale)
+	col = numpy.clip(x, 0, width).astype(numpy.int64)
+	cols, first, count = numpy.unique(col, return_index = True,
+		return_counts = True)
+	last = first + count - 1
+	ends = numpy.append(cols[1:], width)
+
+	out = []
+	for c, e, n, i in zip(cols.tolist(), ends.tolist(), count.tolist(),
+		last.tolist()):
+		if n > 1:
+			if out and out[-1][2] == BUSY and out[-1][1] == c:
+				out[-1] = (out[-1][0], c + 1, BUSY)
+			else:
+				out.append( (c, c + 1, BUSY) )
+			c += 1
+		if e > c:
+			out.append( (c, e, i) )
+	return out
+
+def bound_segments(bounds, width):
+	"""Like segments(), from the number of changes before each column edge
+as returned by Pyramid.bounds(). In place of sample indices, the index k
+of the column edge is returned whose value is shown: the sample of the
+whole trace is bounds[k] - 1, the one of Pyramid.sample() is k."""
+	n = numpy.diff(bounds)
+	cols = numpy.flatnonzero(n)
+	ends = numpy.append(cols[1:], width)
+
+	out = []
+	if bounds[0] > 0 and (not len(cols) or cols[0] > 0):
+		out.append( (0, int(cols[0]) if len(cols) else width, 0) )
+	for c, e, k in zip(cols.tolist(), ends.tolist(), n[cols].tolist()):
+		x = c
+		if k > 1:
+			if out and out[-1][2] == BUSY and out[-1][1] == c:
+				out[-1] = (out[-1][0], c + 1, BUSY)
+			else:
+				out.append( (c, c + 1, BUSY) )
+			x += 1
+		if e > x:
+			out.append( (x, e, c + 1) )
+	return out
+
+def trace_segments(trace, t0, t1, scale, width):
+	"""Cut the window t0..t1 from a Trace and reduce it to segments, see
+segments(). Returns the windowed Trace and its segments. ClockTraces too
+fast to draw are not expanded, their periodic part becomes a busy block."""
+	if isinstance(trace, ClockTrace) and \
+		trace.period * scale < CLOCK_MIN_PERIOD and \
+		trace.phase <= t1 and trace.last >= t0:
+		# Only the irregular head and tail samples, without the edges
+		w = ClockTrace(trace.nets, trace.phase, trace.period, trace.duty, 0,
+			trace.start, trace.head.window(t0, t1), trace.tail.window(t0, t1))
+		w = w.expand()
+		x0 = max(int((trace.phase - t0) * scale), 0)
+		x1 = min(int((trace.last - t0) * scale) + 1, width)
+		segs = segments(w.time, t0, scale, width)
+		out = [ (s[0], min(s[1], x0), s[2]) for s in segs if s[0] < x0 ]
+		out.append( (x0, x1, BUSY) )
+		out += [ (max(s[0], x1), s[1], s[2]) for s in segs if s[1] > x1 ]
+		return w, out
+
+	w = trace.window(t0, t1)
+	return w, segments(w.time, t0, scale, width)
+
+def _bit_row(trace, segs, top, out):
+	hi, lo = top + 2, top + WAVE_HEIGHT
+	path = []
+	for x0, x1, i in segs:
+		v = '?' if i == BUSY else trace.value_str(i)
+		if v == '1' or v == '0':
+			y = hi if v == '1' else lo
+			path.append("%s%d %d L%d %d" % ('L' if path else 'M', x0, y, x1, y))
+			continue
+		if path:
+			out.write('<path class="w" d="%s"/>\n' % ' '.join(path))
+			path = []
+		if v == '?':
+			out.write('<rect class="b" x="%d" y="%d" width="%d" height="%d"/>\n'
+				% (x0, hi, x1 - x0, lo - hi))
+		elif v in 'zZ':
+			y = (hi + lo) // 2
+			out.write('<path class="z" d="M%d %d L%d %d"/>\n' % (x0, y, x1, y))
+		else:
+			out.write('<rect class="x" x="%d" y="%d" width="%d" height="%d"/>\n'
+				% (x0, hi, x1 - x0, lo - hi))
+	if path:
+		out.write('<path class="w" d="%s"/>\n' % ' '.join(path))
+
+def _label(trace, i):
+	if trace.kind == KIND_BITS or trace.kind == KIND_WIDE:
+		return trace.hex_str(i)
+	return str(trace.value_str(i))
+
+def _band_path(band, x0, x1, hi, lo):
+	"SVG path of the value range of the columns x0..x1 - 1 of a busy block"
+	h = lo - hi
+	ys = numpy.floor(lo - band[1][x0:x1] * h).astype(numpy.int64)
+	ye = numpy.maximum(numpy.ceil(lo - band[0][x0:x1] * h).astype(numpy.int64),
+		ys + 1)
+	path = [ 'M%d %d' % (x0, ys[0]) ]
+	for x, y in enumerate(ys.tolist(), x0):
+		path.append('L%d %d L%d %d' % (x, y, x + 1, y))
+	for x, y in reversed(list(enumerate(ye.tolist(), x0))):
+		path.append('L%d %d L%d %d' % (x + 1, y, x, y))
+	return ' '.join(path) + ' Z'
+
+def _bus_row(trace, segs, top, out, band = None):
+	hi, lo = top + 2, top + WAVE_HEIGHT
+	mid = (hi + lo) // 2
+	for x0, x1, i in segs:
+		if i == BUSY:
+			out.write('<rect class="b" x="%d" y="%d" width="%d" height="%d"/>\n'
+				% (x0, hi, x1 - x0, lo - hi))
+			if band is not None:
+				out.write('<path class="e" d="%s"/>\n'
+					% _band_path(band, x0, x1, hi, lo))
+			continue
+		e = min(2, (x1 - x0) // 2)
+		cls = 'x' if (trace.kind == KIND_BITS or trace.kind == KIND_WIDE) \
+			and trace.has_x(i) else 'v'
+		out.write('<path class="%s" d="M%d %d L%d %d L%d %d L%d %d L%d %d '
+			'L%d %d Z"/>\n' % (cls, x0, mid, x0 + e, hi, x1 - e, hi, x1, mid,
+			x1 - e, lo, x0 + e, lo))
+		# Labels only where they fit
+		room = (x1 - x0 - 4) // CHAR_WIDTH
+		if room > 0:
+			s = _label(trace, i)
+			if len(s) > room:
+				s = s[:room - 1] + '~' if room > 1 else ''
+			if s:
+				out.write('<text x="%d" y="%d">%s</text>\n'
+					% (x0 + 3, lo - 3, escape(s)))
+
+def _view(traces, t0, t1, pyramids):
+	"""Return traces and pyramids as lists, and the default time window.
+A trace None is taken from its pyramid."""
+	if isinstance(traces, dict):
+		if isinstance(pyramids, dict):
+			pyramids = [ pyramids.get(code) for code in traces ]
+		traces = list(traces.values())
+	if pyramids is None:
+		pyramids = [ None ] * len(traces)
+	spans = [ (t[0][0], t[-1][0]) if t is not None else (p.start, p.end) \
+		for t, p in zip(traces, pyramids) \
+		if (len(t) if t is not None else p is not None) ]
+	if t0 is None:
+		t0 = min([ s[0] for s in spans ] or [ 0 ])
+	if t1 is None:
+		t1 = max([ s[1] for s in spans ] or [ t0 ])
+	return traces, pyramids, t0, t1
+
+def _values(p, dt):
+	"True if the rows of zoom dt can be drawn from the Pyramid p alone"
+	return p is not None and p.values and p.level(dt) is not None
+
+def pyramid_view(codes, pyramids, read, t0 = None, t1 = None, width = 1000):
+	"""Return (traces, pyramids, t0, t1) lists for render() of the signals
+'codes', given the dict of Pyramids of the trace file. Rows that can be
+drawn from the pyramid values at this zoom get the trace None, the traces
+of the others are got from read(codes, t0, t1), which returns a dict of
+Traces cut to the window."""
+	pyramids = [ pyramids.get(code) for code in codes ]
+	traces = [ None ] * len(codes)
+	if t0 is None or t1 is None:
+		# Signals without pyramid only tell their extent from the trace
+		got = read([ c for c, p in zip(codes, pyramids) if p is None ],
+			None, None)
+		traces = [ got.get(c) for c in codes ]
+		_, _, t0, t1 = _view(traces, t0, t1, pyramids)
+
+	dt = max(t1 - t0, 1) / width
+	need = [ c for c, t, p in zip(codes, traces, pyramids) \
+		if t is None and not _values(p, dt) ]
+	got = read(need, t0, t1) if need else {}
+	traces = [ got.get(c, t) for c, t in zip(codes, traces) ]
+	# Pyramid bounds index the complete trace only
+	pyramids = [ p if t is None else None for t, p in zip(traces, pyramids) ]
+	return traces, pyramids, t0, t1
+
+def _band(p, t0, dt, width):
+	"Smallest and largest value per column, relative to the range of p"
+	lo, hi = p.extremes(t0, dt, width)
+	top = p.levels[-1]
+	vmin, vmax = float(top['min'][0]), float(top['max'][0])
+	span = (vmax - vmin) or 1.0
+	return (lo.astype(float) - vmin) / span, (hi.astype(float) - vmin) / span
+
+def rows(traces, t0, t1, width, pyramids):
+	"""Yield (trace, segments, band) for the rows of render(). Segment
+indices refer to the yielded trace, which is windowed, complete, or a
+Pyramid.sample() one value per column edge. 'band' is None, or the
+smallest and largest value of every column relative to the value range of
+the signal, for shading busy blocks."""
+	scale = width / max(t1 - t0, 1)
+	dt = 1 / scale
+	for trace, p in zip(traces, pyramids):
+		if _values(p, dt):
+			yield p.sample(t0, dt, width), \
+				bound_segments(p.bounds(t0, dt, width), width), \
+				_band(p, t0, dt, width)
+			continue
+		bounds = p.bounds(t0, dt, width) if p is not None else None
+		if bounds is None:
+			w, segs = trace_segments(trace, t0, t1, scale, width)
+			yield w, segs, None
+		else:
+			yield trace, [ (x0, x1, i if i == BUSY else int(bounds[i]) - 1) \
+				for x0, x1, i in bound_segments(bounds, width) ], None
+
+def render(traces, out, t0 = None, t1 = None, width = 1000, pyramids = None):
+	"""Write SVG of the Traces (a list, or a dict as returned by load_vcd())
+between the times t0 and t1, with the waves 'width' pixels wide, to the
+text stream 'out'. Rows are written one by one.
+The optional 'pyramids' (a list, or a dict by the same keys as traces) of
+the complete Traces are used where the zoom level allows, see also
+pyramid_view()."""
+	traces, pyramids, t0, t1 = _view(traces, t0, t1, pyramids)
+
+	out.write('<svg xmlns="http://www.w3.org/2000/svg" '
+		'width="%d" height="%d">\n' % (NAME_WIDTH + width,
+		ROW_HEIGHT * len(traces)))
+	out.write(_STYLE)
+	for r, (w, segs, band) in enumerate(rows(traces, t0, t1, width,
+		pyramids)):
+		top = r * ROW_HEIGHT
+		out.write('<text x="2" y="%d">%s</text>\n'
+			% (top + WAVE_HEIGHT - 2, escape(w.name)))
+		out.write('<g transform="translate(%d,0)">\n' % NAME_WIDTH)
+		if w.kind == KIND_BITS and w.size == 1:
+			_bit_row(w, segs, top, out)
+		else:
+			_bus_row(w, segs, top, out, band)
+		out.write('</g>\n')
+	out.write('</svg>\n')
+
+def vcd2svg(vcdfile, siglist = [], t0 = None, t1 = None, width = 1000,
+	out = None, cache = True, pyramid = False):
+	"""Render the signals in siglist (all if empty) of a trace file between
+times t0 and t1 as SVG. Only the window is parsed. With 'out' None the SVG
+is returned as string, otherwise written to the file name or stream.
+With 'pyramid' set, zoomed out rows are drawn from the pyramids of
+vcdpyramid, and only the window of the other rows is read."""
+	pyramids = None
+	if pyramid:
+		pyramids = load_pyramids(vcdfile)
+		index = load_index(vcdfile)
+		codes = set(index.codes(siglist)) if siglist else pyramids
+		codes = [ code for code in pyramids if code in codes ]
+
+		def read(codes, t0, t1):
+			names = [ n['hier'] + '.' + n['name'] \
+				for code in codes for n in index.sigs[code]['nets'] ]
+			return read_cached(vcdfile, names, t0 = t0, t1 = t1)[0]
+
+		traces, pyramids, t0, t1 = pyramid_view(codes, pyramids, read,
+			t0, t1, width)
+	elif cache:
+		traces = load_vcd_cached(vcdfile, siglist, t0 = t0, t1 = t1)
+	else:
+		traces = load_vcd(vcdfile, siglist, t0 = t0, t1 = t1)
+
+	if out is None:
+		buf = io.StringIO()
+		render(traces, buf, t0, t1, width, pyramids)
+		return buf.getvalue()
+	if isinstance(out, str):
+		with open(out, 'w') as f:
+			render(traces, f, t0, t1, width, pyramids)
+	else:
+		render(traces, out, t0, t1, width, pyramids)
+
+def show(vcdfile, siglist = [], t0 = None, t1 = None, width = 1000):
+	"Display the SVG rendering of a trace in a notebook"
+	from IPython.display import SVG
+	return SVG(vcd2svg(vcdfile, siglist, t0, t1, width))
+
+if __name__ == '__main__':
+	if len(sys.argv) < 3:
+		print("Usage: %s trace.vcd out.svg [signal ...]" % sys.argv[0])
+		sys.exit(1)
+	vcd2svg(sys.argv[1], sys.argv[3:], out = sys.argv[2], cache = False)